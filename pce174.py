@@ -8,113 +8,620 @@ or compatible devices like the Extech HD450
 """
 
 # from stdlib
-import sys, argparse, binascii, warnings, datetime, time
-from collections import OrderedDict
+import sys, argparse, binascii, warnings, datetime, time, contextlib, struct, functools, threading
+import os, json, signal, socket, socketserver, tempfile, asyncio, concurrent.futures
+import random, select, shlex, sqlite3, hashlib, mmap, bisect, glob, math
+from collections import OrderedDict, namedtuple, deque
 # others
 import serial
 from construct import * # requires construct ≥ 2.8 (tested with 2.9)
+try:
+    import numpy as np # optional, only needed for the numpy decoder
+except ImportError:
+    np = None
 
 __version__ = 1.0
 __author__ = "Philipp Pagel"
 __copyright__ = "Copyright 2018, 2019, Philipp Pagel"
 __license__ = "MIT License"
 
+# available decoder backends for `repr` and `csv` output (see decode_blob)
+DECODERS = ("construct", "fast", "numpy")
+DEFAULT_DECODER = "fast"
+PACINGS = ("fixed", "adaptive")
+
+# command codes of button presses
+# lower case: short press, upper case: long press/hold
+BUTTONS = {
+        'units':    0xfe,
+        'light':    0xfd,
+        'load':     0xfd,
+        'range':    0x7f,
+        'apo':      0x7f,
+        'rec':      0xfb,
+        'peak':     0xf7,
+        'left':     0xf7,
+        'rel':      0xdf,
+        'right':    0xdf,
+        'min':      0xbf,
+        'max':      0xbf,
+        'up':       0xbf,
+        'hold':     0xef,
+        'down':     0xef,
+        'off':      0xf3,
+        'REC':      0xdc,
+        'PEAK':     0xda,
+        'LEFT':     0xda,
+        'LOAD':     0xdb,
+        'LIGHT':    0xdb,
+        'REL':      0xde,
+        'RIGHT':    0xde
+        }
+
+# measurement ranges by range level (stat0 bits 1,0)
+# I know this looks wrong but that's how they implemented the range order...
+RANGES = {"lux": ("400k", "400", "4k", "40k"), "fc": ("40k", "40", "400", "4k")}
+# decimal exponent of Frange for each range
+RANGE_EXPONENT = {"40": -2, "400": -1, "4k": 0, "40k": 1, "400k": 2}
+
 
 def main():
     "The main function"
 
     args = getargs()
 
-    if args.command=="press":
+    if len(args.ports) > 1:
+        if args.command != "log":
+            sys.exit("Only `log` accepts more than one port")
+        if args.window or args.threshold is not None:
+            sys.exit("Aggregation is not supported with more than one port")
+        if args.format == "sqlite":
+            sys.exit("SQLite output is not supported with more than one port")
+        if args.archive:
+            sys.exit("Archives are not supported with more than one port")
+        if args.format == "raw":
+            sys.exit("Raw output is not supported with more than one port")
+        if args.stats or args.timings:
+            sys.exit("--stats and --timings are not supported with more than one port")
+        with (WireCapture(args.capture) if args.capture else contextlib.nullcontext()) as capture:
+            log_multi(
+                args.ports, outformat=args.format, sampleno=args.sampleno, interval=args.samplingint, sep=args.sep,
+                decoder=args.decoder, capture=capture,
+            )
+        return
+    if args.capture and args.command in ("simulate", "bench", "extract", "replay", "convert"):
+        sys.exit("--capture only works with commands that talk to an instrument")
+    if (args.stats or args.timings) and args.command in ("simulate", "bench", "extract", "convert", "serve"):
+        sys.exit("--stats and --timings only work with `replay` and commands that talk to an instrument")
+    if args.command=="simulate":
+        # run a virtual instrument on a pseudo-terminal
+        simulate(latency=args.latency, baudrate=args.baud, corrupt=args.corrupt, settle=args.settle)
+        return
+    if args.command=="bench":
+        # benchmark decoding and command round trips
+        parts = args.args or ("decode", "roundtrip")
+        for part in parts:
+            if part not in ("decode", "roundtrip"):
+                sys.exit("Unknown benchmark `{}`".format(part))
+        repeat = args.sampleno if args.sampleno > 0 else 20
+        print(json.dumps(bench(repeat=repeat, parts=parts), indent=2))
+        return
+    if args.command=="extract":
+        # convert the records of an archive
+        if not 1 <= len(args.args) <= 3:
+            sys.exit("'extract' command takes 1 to 3 arguments ({} given)".format(len(args.args)))
+        if args.format not in ("csv", "repr", "raw", "hex"):
+            sys.exit("'extract' supports the csv, repr, raw and hex formats")
+        start, end = (parse_time(arg) for arg in (args.args[1:] + [None, None])[:2])
+        extract_archive(args.args[0], args.format, sep=args.sep, start=start, end=end, decoder=args.decoder)
+        return
+    if args.command=="convert":
+        # decode raw dumps in bulk
+        if not args.args:
+            sys.exit("'convert' command takes at least 1 argument")
+        if args.format not in ("csv", "repr"):
+            sys.exit("'convert' supports the csv and repr formats")
+        if convert(args.args, args.format, sep=args.sep, decoder=args.decoder, invalid=args.invalid, jobs=args.jobs):
+            sys.exit(1)
+        return
+    if args.command=="serve":
+        # run daemon serving live data to local clients
+        with (WireCapture(args.capture) if args.capture else contextlib.nullcontext()) as capture:
+            serve(args.port, interval=args.samplingint, socket_path=args.socket, decoder=args.decoder, capture=capture)
+        return
+
+    timer = None
+    if args.stats or args.timings:
+        timer = PhaseTimer(open(args.timings, "w") if args.timings else None)
+        if hasattr(signal, "SIGUSR1"):  # not on Windows
+            signal.signal(signal.SIGUSR1, lambda signum, frame: sys.stderr.write(timer.report() + "\n"))
+    try:
+        if args.command=="replay":
+            # decode the responses recorded with --capture again
+            if len(args.args)!=1:
+                sys.exit("'replay' command takes exactly 1 argument ({} given)".format(len(args.args)))
+            if args.format == "sqlite":
+                sys.exit("'replay' does not support sqlite output")
+            n = replay(
+                args.args[0], args.format, sep=args.sep, speed=args.speed, decoder=args.decoder,
+                invalid=args.invalid, timer=timer,
+            )
+            sys.stderr.write("{} response(s) replayed\n".format(n))
+        else:
+            run_command(args, timer)
+    finally:
+        if timer is not None:
+            timer.finish()
+            if args.stats:
+                sys.stderr.write(timer.report() + "\n")
+            if timer.sidefile is not None:
+                timer.sidefile.close()
+
+
+def run_command(args, timer=None):
+    "run a command that talks to a single instrument"
+
+    socket_path = args.socket or default_socket_path(args.port)
+    with (WireCapture(args.capture) if args.capture else contextlib.nullcontext()) as capture, PCE174(
+        args.port, decoder=args.decoder, invalid=args.invalid, socket=socket_path, timer=timer, pacing=args.pacing,
+        capture=capture,
+    ) as meter, (SQLiteWriter(args.db) if args.db else contextlib.nullcontext()) as db:
+        if args.command=="batch":
+            # run commands from a file or STDIN over this session
+            if len(args.args)>1:
+                sys.exit("'batch' command takes at most 1 argument ({} given)".format(len(args.args)))
+            infile = sys.stdin if not args.args or args.args[0]=="-" else open(args.args[0])
+            with infile:
+                errors = run_batch(meter, infile, args, db)
+            if errors:
+                sys.exit(1)
+        else:
+            execute(meter, args.command, args.args, args, db)
+
+
+def execute(meter, command, cmdargs, args, db=None):
+    """run command with arguments cmdargs on session meter
+
+    args holds the remaining command line options (format, separator, ...)
+    and db is the SQLiteWriter for the sqlite format.
+    """
+
+    if command=="press":
         # press buttons
-        if len(args.args)!=1:
-            sys.exit("'press' expects a single argument, {} found".format(len(button)))
-        press_button(args.port, args.args[0])
-    elif args.command=="get":
+        if len(cmdargs)!=1:
+            sys.exit("'press' expects a single argument, {} found".format(len(cmdargs)))
+        meter.press_button(cmdargs[0])
+    elif command=="get":
         # get status information
-        if len(args.args)!=1:
-            sys.exit("'get' command takes exactly 1 argument ({} given)".format(len(args.args)))
-        print(getvar(args.port, args.args[0]))
-    elif args.command=="set":
-        # set things
-        if len(args.args)!=2:
-            sys.exit("'set' command takes exactly 2 argument ({} given)".format(len(args.args)))
-        setvar(args.port, var=args.args[0], value=args.args[1])
-    elif args.command=="read":
+        if len(cmdargs)!=1:
+            sys.exit("'get' command takes exactly 1 argument ({} given)".format(len(cmdargs)))
+        # the latest reading of a `serve` daemon is used if one holds the port
+        print(meter.getvar(cmdargs[0], cached=True))
+    elif command=="set":
+        # set things, either `set var value` or `set var=value [var=value ...]`
+        if cmdargs and all("=" in arg for arg in cmdargs):
+            meter.setvars(dict(arg.split("=", 1) for arg in cmdargs))
+        elif len(cmdargs)==2:
+            meter.setvar(var=cmdargs[0], value=cmdargs[1])
+        else:
+            sys.exit("'set' command takes 2 arguments or var=value pairs ({} given)".format(len(cmdargs)))
+    elif command=="read":
         # read data from instrument
-        if len(args.args)!=1:
-            sys.exit("'read' command takes exactly 1 argument ({} given)".format(len(args.args)))
-        dat = read_data(port=args.port, datatype=args.args[0], outformat=args.format, sep=args.sep, fromfile=args.file, header=True)
-        if args.format in ('repr', 'csv', 'construct'):
-            dat = str(dat) + "\n"
-            dat = dat.encode("utf-8")
-        sys.stdout.buffer.write(bytes(dat))
+        if len(cmdargs)!=1:
+            sys.exit("'read' command takes exactly 1 argument ({} given)".format(len(cmdargs)))
+        cache = None
+        header = not args.no_header
+        if args.new_only:
+            if cmdargs[0]!="logger":
+                sys.exit("--new-only only works with `read logger`")
+            cache = LoggerCache(args.cache)
+        if db is not None:
+            dat = meter.read_data(
+                datatype=cmdargs[0], fromfile=args.file, groups=args.groups, jobs=args.jobs, cache=cache,
+                cached=True,
+            )
+            n = db.write(cmdargs[0], [dat] if cmdargs[0] == "live" else dat, port=meter.port)
+            sys.stderr.write("{} {} record(s) written to {}\n".format(n, cmdargs[0], db.path))
+        else:
+            # csv is written to STDOUT in chunks while it is formatted
+            dat = meter.read_data(
+                datatype=cmdargs[0], outformat=args.format, sep=args.sep, fromfile=args.file,
+                header=header, groups=args.groups, jobs=args.jobs,
+                out=sys.stdout.buffer if args.format == "csv" else None, cache=cache, cached=True,
+            )
+            with meter.phase("output"):
+                if dat is not None:
+                    if args.format in ('repr', 'csv', 'construct'):
+                        dat = str(dat) + "\n"
+                        dat = dat.encode("utf-8")
+                    sys.stdout.buffer.write(bytes(dat))
+        # only remember the groups once they were written
+        if cache is not None:
+            cache.save()
         #print(dat)
-    elif args.command=="log":
+    elif command=="log":
         # tethered logging
-        log_live_data(port=args.port, outformat=args.format, sampleno=args.sampleno, interval=args.samplingint, sep=args.sep)
-    elif args.command=="setup":
+        with (FrameArchive(args.archive, "a") if args.archive else contextlib.nullcontext()) as archive:
+            meter.log_live_data(
+                outformat=args.format, sampleno=args.sampleno, interval=args.samplingint, sep=args.sep,
+                window=args.window, threshold=args.threshold, db=db, archive=archive,
+            )
+    elif command=="setup":
         # enter/exit setup
-        send_cmd(args.port, 0xfa)
+        meter.send_cmd(0xfa)
     else:
-        sys.exit("Unknown command `{}`\nTry -h for help".format(args.command))
+        sys.exit("Unknown command `{}`\nTry -h for help".format(command))
 
 
-def press_button(port, button, n=1):
-    """Send button press to instrument
+def run_batch(meter, infile, args, db=None):
+    """run the commands in infile one after the other on session meter
 
-    Valid values of button: units, light, load, range, apo, rec, peak, left, rel,
-        right, max, min, up, hold, down, off, REC, PEAK, REL, LOAD, LIGHT
-    
-    lower case button names indicate a short press
-    upper case button names indicate a long press/hold
+    Each line holds one command with its arguments as on the command line,
+    e.g. `set unit lux`. Empty lines and comments starting with `#` are
+    ignored. Output is flushed after each command. Errors are reported on
+    STDERR with their line number. Unless args.keep_going is set, the first
+    error stops the batch.
+
+    returns the number of failed commands
     """
 
-    cmd = {
-            'units':    0xfe,
-            'light':    0xfd,
-            'load':     0xfd,
-            'range':    0x7f,
-            'apo':      0x7f,
-            'rec':      0xfb,
-            'peak':     0xf7,
-            'left':     0xf7,
-            'rel':      0xdf,
-            'right':    0xdf,
-            'min':      0xbf,
-            'max':      0xbf,
-            'up':       0xbf,
-            'hold':     0xef,
-            'down':     0xef,
-            'off':      0xf3,
-            'REC':      0xdc,
-            'PEAK':     0xda,
-            'LEFT':     0xda,
-            'LOAD':     0xdb,
-            'LIGHT':    0xdb,
-            'REL':      0xde,
-            'RIGHT':    0xde
-            } 
-
-    if button not in cmd:
-        sys.exit("Unknown button '{}'".format(button))
-    
-    for i in range(n):
-        send_cmd(port, cmd[button])
-        if n>1:
-            time.sleep(.25)
+    errors = 0
+    for lineno, line in enumerate(infile, 1):
+        try:
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            if words[0] == "batch":
+                sys.exit("'batch' cannot be nested")
+            execute(meter, words[0], words[1:], args, db)
+        except SystemExit as e:
+            if e.code in (None, 0):
+                continue
+            message = e.code
+        except Exception as e:
+            message = "{}: {}".format(type(e).__name__, e)
+        else:
+            sys.stdout.flush()
+            continue
+        sys.stdout.flush()
+        sys.stderr.write("line {}: {}\n".format(lineno, message))
+        errors += 1
+        if not args.keep_going:
+            break
+    return errors
 
 
-def getvar(port, var):
-    """return the requested type of mode/status data
+class WireCapture:
+    """Record all bytes sent to and received from instruments
+
+    Each transfer is written as one line of JSON to the capture file:
+
+    Key   | Description
+    ------|------------------------------------------------------
+    t     | host time of the transfer (seconds since the epoch)
+    port  | serial port
+    dir   | `tx` (sent to the instrument) or `rx` (received)
+    data  | the bytes in hex
+
+    The capture can be shared by several sessions, also from different
+    threads. Captures can be decoded again with `replay`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w")
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, port, direction, data):
+        "write a transfer of data in direction (tx/rx) on port to the capture"
+
+        line = json.dumps({"t": time.time(), "port": port, "dir": direction, "data": data.hex()}) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        "close the capture file"
+
+        self.file.close()
+
+
+class CapturingSerial:
+    "Wrapper of a serial port that records all transfers to a WireCapture"
+
+    def __init__(self, iface, capture, port):
+        self.iface = iface
+        self.capture = capture
+        self.port = port
+
+    @property
+    def in_waiting(self):
+        return self.iface.in_waiting
+
+    def reset_input_buffer(self):
+        self.iface.reset_input_buffer()
+
+    def write(self, data):
+        self.capture.record(self.port, "tx", data)
+        return self.iface.write(data)
+
+    def read(self, size=1):
+        data = self.iface.read(size)
+        if data:
+            self.capture.record(self.port, "rx", data)
+        return data
+
+    def close(self):
+        self.iface.close()
+
+
+class PCE174:
+    """A session with a PCE-174 instrument
+
+    The session owns one open serial port for its whole lifetime, so that
+    sequences of commands (e.g. `setvar` or tethered logging) do not pay for
+    opening and closing the port on every command byte. The port is opened on
+    first use or by entering the context manager and closed on exit:
+
+        with PCE174("/dev/ttyUSB0") as meter:
+            meter.setvar("unit", "lux")
+            dat = meter.read_data("live")
+
+    port     : string indicating the serial port to use. E.g. /dev/ttyUSB0
+    timeout  : Timeout for serial communication
+    decoder  : decoder backend for received data (see decode_blob)
+    invalid  : handling of saved data registers with invalid data (see decode_blob)
+    socket   : path of the socket of a daemon started with `serve`. While a
+               daemon is listening there, the port is not opened. Only
+               `read_data` and `getvar` with cached=True use the daemon's latest
+               live reading, everything else exits with an error message.
+    timer    : optional PhaseTimer that records how long each command spends
+               in its phases
+    pacing   : `fixed` waits 0.25 s between button presses. `adaptive` polls
+               the status after each press until the expected change shows up
+               (see press_and_confirm)
+    capture  : optional WireCapture that records all bytes sent and received
     """
 
-    dat = read_data(port=port, datatype='live', outformat='raw')
-    dat = parse_live_data(dat)
-    dat = process_live_data(dat)
+    def __init__(self, port, timeout=0.1, decoder=None, invalid="raise", socket=None, timer=None, pacing="fixed",
+                 capture=None):
+        if pacing not in PACINGS:
+            raise Exception("Unknown pacing `{}`".format(pacing))
+        self.pacing = pacing
+        self.settle = RunningStats()  # time until button presses show up in the status [s]
+        self.press_timeout = 1.0
+        self.port = port
+        self.timeout = timeout
+        self.decoder = decoder
+        self.invalid = invalid
+        self.socket = socket
+        self.timer = timer
+        self.capture = capture
+        self.iface = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        "open the serial port unless it is already open"
+
+        if self.iface is None:
+            if self.socket and daemon_request(self.socket) is not None:
+                sys.exit("A `serve` daemon holds {} (socket {}), only `read live` and `get` work while it runs".format(
+                    self.port, self.socket))
+            with self.phase("open"):
+                self.iface = serial.Serial(
+                    port=self.port, baudrate=9600, bytesize=8, parity="N", stopbits=1, timeout=self.timeout
+                )
+                if self.capture is not None:
+                    self.iface = CapturingSerial(self.iface, self.capture, self.port)
+
+    def close(self):
+        "close the serial port"
+
+        if self.iface is not None:
+            self.iface.close()
+            self.iface = None
+
+    def phase(self, name):
+        "context manager timing phase name of the current command if there is a timer"
+
+        if self.timer is None:
+            return contextlib.nullcontext()
+        return self.timer.phase(name)
+
+    def send_cmd(self, cmd, read=False):
+        """Send command byte to instrument
+
+        cmd      : a single byte to be sent
+        read     : If True try to read data from the instrument after sending command
+
+        returns the binary blob that is received in response or empty byte array
+        """
+
+        if self.timer is not None:
+            self.timer.begin("0x{:02x}".format(cmd))
+        self.open()
+
+        hello = b"\x87\x83"  # command prefix
+        msg = hello + bytes([cmd])
+        # discard anything left over from earlier responses, e.g. the trailing
+        # zero bytes of a saved data dump
+        with self.phase("write"):
+            self.iface.reset_input_buffer()
+            self.iface.write(msg)
+
+        blob = b""
+        if read:
+            blob = self.read_frame()
+
+        return blob
+
+    def read_frame(self):
+        """Read one response frame from the instrument
+
+        The length of live, saved and logger data blobs is known from their
+        magic number (and the header of logger data), so the frame is read in
+        bulk and returned as soon as it is complete. Unknown responses are
+        read until the line has been idle for `timeout`.
+
+        Leading 0x00 bytes are skipped as no known frame starts with them.
+        """
+
+        with self.phase("first_byte"):
+            head = self._read(2)
+        with self.phase("transfer"):
+            while len(head) == 2 and head[0] == 0:
+                byte = self._read(1)
+                if not byte:
+                    break
+                head = head[1:] + byte
+            if head in (b"\xaa\xdd", b"\xbb\x88", b"\xaa\xcc"):
+                return self._read_known_frame(head)
+        with self.phase("idle"):
+            return head + self.read_until_idle()
+
+    def _read_known_frame(self, head):
+        "read the rest of a live, saved or logger data frame starting with magic number head"
+
+        if head == b"\xaa\xdd":
+            # live data: 18 bytes
+            return head + self._read(16)
+        elif head == b"\xbb\x88":
+            # saved data: 99 records of 13 bytes, trailing zeros are ignored
+            return head + self._read(99 * 13)
+        elif head == b"\xaa\xcc":
+            # logger data: header with number of groups and buffer size
+            header = self._read(3)
+            if len(header) < 3:
+                return head + header
+            bufsize = int.from_bytes(header[1:3], "big")
+            return head + header + self._read(bufsize)
+
+    def read_until_idle(self):
+        "read from the instrument until the line is idle for `timeout`"
+
+        blob = b""
+        while True:
+            chunk = self.iface.read(max(1, self.iface.in_waiting))
+            if not chunk:
+                break
+            blob += chunk
+        return blob
+
+    def _read(self, size):
+        """read size bytes from the instrument
+
+        Returns as soon as size bytes have arrived. Returns less if the line
+        stays idle for `timeout`.
+        """
+
+        blob = b""
+        while len(blob) < size:
+            chunk = self.iface.read(size - len(blob))
+            if not chunk:
+                break
+            blob += chunk
+        return blob
+
+    def press_button(self, button, n=1, stat=None):
+        """Send button press to instrument
+
+        Valid values of button: units, light, load, range, apo, rec, peak, left, rel,
+            right, max, min, up, hold, down, off, REC, PEAK, REL, LOAD, LIGHT
+        
+        lower case button names indicate a short press
+        upper case button names indicate a long press/hold
+
+        With adaptive pacing, presses of buttons that change settings are
+        confirmed by polling (see press_and_confirm) if their effect is known
+        (see press_known). stat optionally is the current status, which saves
+        reading it first. Returns the status after the presses in that case
+        and None otherwise.
+        """
+
+
+        if button not in BUTTONS:
+            sys.exit("Unknown button '{}'".format(button))
+
+        if self.pacing == "adaptive" and button in SETTING_BUTTONS:
+            if stat is None:
+                stat = self.read_status()
+            expected = stat
+            for i in range(n):
+                if expected is None or not press_known(expected, button):
+                    break
+                expected = press_effect(expected, BUTTONS[button])
+            else:
+                for i in range(n):
+                    stat = self.press_and_confirm(button, stat)
+                return stat
+
+        for i in range(n):
+            self.send_cmd(BUTTONS[button])
+            if n>1:
+                time.sleep(.25)
+
+    def read_status(self):
+        """return the status of the instrument as a dict
+
+        Only the status bytes of live data are decoded. Returns None if the
+        response is not valid live data.
+        """
+
+        blob = self.send_cmd(0x11, read=True)
+        if len(blob) != LIVE_LAYOUT.size or blob[:2] != b"\xaa\xdd":
+            return None
+        stat = decode_stat0(blob[14])
+        stat.update(decode_stat1(blob[15]))
+        return stat
+
+    def press_and_confirm(self, button, stat):
+        """press button and poll the status until the expected change shows up
+
+        stat is the status before the press. The expected status is computed
+        with press_effect. Polling starts after the shortest settle time
+        observed so far, so later presses wait about as long as the
+        instrument needs. Exits with an error message if the change does not
+        show up within `press_timeout` seconds.
+
+        returns the new status
+        """
+
+        expected = press_effect(stat, BUTTONS[button])
+        self.send_cmd(BUTTONS[button])
+        start = time.monotonic()
+        if self.settle.count:
+            time.sleep(self.settle.min)
+        while True:
+            new = self.read_status()
+            elapsed = time.monotonic() - start
+            if new is not None and all(new[var] == expected[var] for var in ("unit", "range", "mode", "hold", "view")):
+                self.settle.add(elapsed)
+                return new
+            if elapsed > self.press_timeout:
+                sys.exit("Error: `{}` press not confirmed within {} s".format(button, self.press_timeout))
+            time.sleep(0.02)
+
+    def getvar(self, var, cached=False):
+        """return the requested type of mode/status data
+
+        cached=True accepts the latest reading of a `serve` daemon (see read_data)
+        """
 
-    if var=="status":
-        dat = """date:       {date}
+        dat = self.read_data(datatype='live', outformat='repr', cached=cached)
+
+        if var=="status":
+            dat = """date:       {date}
 weekday:    {weekday}
 time:       {time}
 unit:       {unit}
@@ -126,76 +633,333 @@ power:      {power}
 view:       {view}
 memstat:    {memstat}
 read_no:    {read_no}""".format_map(dat)
-    else:
-        if var not in dat.keys():
-            sys.exit("Unknown parameter '{}'".format(var))
-        dat = dat[var] 
-    return dat
+        else:
+            if var not in dat.keys():
+                sys.exit("Unknown parameter '{}'".format(var))
+            dat = dat[var] 
+        return dat
+
+    def setvar(self, var, value):
+        "set variable var to value"
+
+        self.setvars({var: value})
+
+    def setvars(self, settings):
+        """set several variables at once
+
+        settings is a dict of variable names and values, e.g. {"unit": "lux",
+        "range": "4k"}. The button presses for all variables are planned from
+        a single status snapshot (see plan_presses), sent back to back and
+        verified with a single read at the end.
+        """
+
+        stat = self.read_data(datatype='live')
+        settings = check_settings(settings, stat)
+        plan = plan_presses(stat, settings)
+        if plan is None:
+            sys.exit("Error: Failed to set {}".format(", ".join(
+                "`{}` to `{}`".format(var, value) for var, value in settings.items() if stat[var] != value
+            )))
+        if not plan:
+            return # No change of settings necessary
+
+        if self.pacing == "adaptive":
+            # each press is confirmed, the last status needs no extra read
+            for button, n in plan:
+                stat = self.press_button(button, n, stat)
+        else:
+            time.sleep(.25)
+            for button, n in plan:
+                self.press_button(button, n)
+
+            # test success
+            time.sleep(.25)
+            stat = self.read_data(datatype='live')
+        failed = [var for var, value in settings.items() if stat[var] != value]
+        if failed:
+            sys.exit("Error: Failed to set {}".format(", ".join(
+                "`{}` to `{}`".format(var, settings[var]) for var in failed
+            )))
+
+    def log_live_data(self, outformat, sampleno, interval, sep=",", window=None, threshold=None, db=None, archive=None):
+        """Log live data (tethered logging)
+
+        Samples are taken on a fixed grid of `interval` seconds (see
+        SampleClock). Slots that are missed because the instrument or output
+        was too slow are skipped and reported on STDERR. If interval <= 0,
+        samples are taken as fast as the instrument answers. sampleno <= 0
+        means logging until interrupted.
+
+        window > 0 writes the statistics of each window of `window` seconds
+        (see WindowStats) instead of the samples. threshold writes a sample
+        only if its value differs by more than threshold from the last sample
+        written or the unit changed. Both work with the csv and repr formats.
+
+        With outformat `sqlite`, the samples are added to db (a SQLiteWriter),
+        which commits them in batches. If archive (a FrameArchive open for
+        appending) is given, the live data blobs are appended to it instead of
+        being written to STDOUT.
+
+        A timing summary is written to STDERR at the end and returned as a dict.
+        """
+
+        if window and threshold is not None:
+            sys.exit("Aggregation windows and a change threshold cannot be combined")
+        if archive is not None and (window or threshold is not None or db is not None):
+            sys.exit("Archives cannot be combined with aggregation, a change threshold or sqlite")
+        if (window or threshold is not None) and outformat not in ("csv", "repr"):
+            sys.exit("Aggregation and change threshold require csv or repr format")
+        if outformat == "sqlite" and db is None:
+            raise Exception("sqlite format requires a database")
+        if sampleno <= 0:
+            sampleno = float('Inf')
+        clock = SampleClock(interval)
+        aggregate = WindowStats(window) if window else None
+        written = None  # last record written in threshold mode
+        windows = 0     # number of windows written
+
+        def write(dat):
+            with self.phase("output"):
+                if outformat == "raw":
+                    pass  # live data blobs back to back, like `read -f raw`
+                elif outformat == "hex":
+                    dat = dat + b"\n"
+                else:
+                    dat = (str(dat) + "\n").encode("utf-8")
+                sys.stdout.buffer.write(bytes(dat))
+                sys.stdout.flush()
+
+        def write_window(result):
+            nonlocal windows
+            if outformat == "repr":
+                write(dict(result))
+            else:
+                if windows == 0:
+                    write(sep.join(AGGREGATE_COLUMNS))
+                write(sep.join(str(result[col]) for col in AGGREGATE_COLUMNS))
+            windows += 1
+
+        try:
+            while clock.samples < sampleno:
+                skipped = clock.wait()
+                if skipped:
+                    sys.stderr.write("Skipped {} sampling slot(s)\n".format(skipped))
+                if aggregate is not None:
+                    result = aggregate.add(clock.last - clock.start, self.read_data(datatype="live"))
+                    if result is not None:
+                        write_window(result)
+                elif db is not None:
+                    rec = self.read_data(datatype="live")
+                    with self.phase("output"):
+                        db.add(rec, port=self.port)
+                elif archive is not None:
+                    blob = self.read_data(datatype="live", outformat="raw")
+                    with self.phase("output"):
+                        archive.append(time.time(), blob)
+                elif threshold is not None:
+                    rec = self.read_data(datatype="live")
+                    if written is None or rec["unit"] != written["unit"] or abs(rec["value"] - written["value"]) > threshold:
+                        write(rec if outformat == "repr" else live_data2csv(rec, sep, header=written is None))
+                        written = rec
+                else:
+                    write(self.read_data(datatype="live", outformat=outformat, sep=sep, header=clock.samples==1))
+        finally:
+            if aggregate is not None and aggregate.result() is not None:
+                write_window(aggregate.result())
+            sys.stderr.write(clock.report() + "\n")
+        return clock.summary()
+
+    def read_data(self, datatype, outformat="repr", sep=",", fromfile="", header=False, groups=None, jobs=1, out=None, cache=None,
+                  cached=False):
+        """
+        read data from the instrument and return the results in the specified outformat
+
+        See the module level function `read_data` for a description of the arguments.
+        cached=True returns the latest live reading of the `serve` daemon
+        listening on `socket` if there is one. It may be up to the polling
+        interval of the daemon old.
+        """
+        
+        cmd = {
+                "live":     0x11,
+                "saved":    0x12,
+                "logger":   0x13
+                }
+
+        dat = None
+        if datatype not in cmd.keys():
+            sys.exit("Unknown data type '{}'".format(datatype))
+        else:
+            if len(fromfile)>0:
+                # parse previously saved raw data, the instrument is not needed
+                with open(fromfile, "rb") as infile:
+                    dat = infile.read()
+            else:
+                if datatype == "live" and cached and self.socket:
+                    reply = daemon_request(self.socket)
+                    if reply is not None:
+                        return decode_blob(
+                            bytes.fromhex(reply["raw"]), datatype, outformat, sep, header=header,
+                            decoder=self.decoder, out=out,
+                        )
+                dat = self.send_cmd(cmd[datatype], read=True) 
+            if datatype == "logger" and cache is not None:
+                with self.phase("decode"):
+                    return new_logger_data(dat, cache, outformat, sep, header=header, groups=groups, out=out)
+            with self.phase("decode"):
+                dat = decode_blob(
+                    dat, datatype, outformat, sep, header=header, decoder=self.decoder,
+                    invalid=self.invalid, groups=groups, jobs=jobs, out=out,
+                )
+        return dat
+
+
+class AsyncPCE174:
+    """asyncio client for a PCE-174 instrument
+
+    Wraps a PCE174 session for use from asyncio code:
+
+        async with AsyncPCE174("/dev/ttyUSB0") as meter:
+            await meter.press("hold")
+            dat = await meter.read_live()
+
+    The blocking serial I/O and decoding run in a dedicated worker thread, so
+    the event loop keeps running while e.g. a saved data dump transfers.
+    Concurrent calls on one instance are serialized and run in the order they
+    were made.
+
+    The arguments are the same as for PCE174.
+    """
+
+    def __init__(self, port, timeout=0.1, decoder=None, invalid="raise"):
+        self.meter = PCE174(port, timeout=timeout, decoder=decoder, invalid=invalid)
+        self._lock = asyncio.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        "run func in the worker thread, one call at a time"
+
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def open(self):
+        "open the serial port"
+
+        await self._run(self.meter.open)
+
+    async def close(self):
+        "close the serial port and stop the worker thread"
+
+        await self._run(self.meter.close)
+        self._executor.shutdown(wait=False)
+
+    async def send_cmd(self, cmd, read=False):
+        "send command byte to instrument (see PCE174.send_cmd)"
+
+        return await self._run(self.meter.send_cmd, cmd, read=read)
+
+    async def read_live(self, outformat="repr", sep=","):
+        "return live data in outformat (see read_data)"
+
+        return await self._run(self.meter.read_data, "live", outformat=outformat, sep=sep)
+
+    async def read_saved(self, outformat="repr", sep=","):
+        "return saved data in outformat (see read_data)"
+
+        return await self._run(self.meter.read_data, "saved", outformat=outformat, sep=sep)
+
+    async def read_logger(self, outformat="repr", sep=",", groups=None):
+        "return logger data in outformat (see read_data)"
+
+        return await self._run(
+            self.meter.read_data, "logger", outformat=outformat, sep=sep, groups=groups
+        )
+
+    async def press(self, button, n=1):
+        "send button press to instrument (see press_button)"
+
+        await self._run(self.meter.press_button, button, n)
+
+    async def get(self, var):
+        "return the requested type of mode/status data (see getvar)"
+
+        return await self._run(self.meter.getvar, var)
+
+    async def set(self, var, value):
+        "set variable var to value (see setvar)"
+
+        await self._run(self.meter.setvar, var, value)
+
+
+def session(port, timeout=0.1):
+    """return a context manager providing a PCE174 session for port
+
+    port may be the name of a serial port, in which case a new session is
+    opened and closed again when leaving the context, or an existing PCE174
+    session which is used as it is and left open.
+    """
+
+    if isinstance(port, PCE174):
+        return contextlib.nullcontext(port)
+    return PCE174(port, timeout=timeout)
+
+
+def press_button(port, button, n=1):
+    """Send button press to instrument
+
+    port may be a serial port name or an open PCE174 session.
+
+    Valid values of button: units, light, load, range, apo, rec, peak, left, rel,
+        right, max, min, up, hold, down, off, REC, PEAK, REL, LOAD, LIGHT
+    
+    lower case button names indicate a short press
+    upper case button names indicate a long press/hold
+    """
+
+    with session(port) as meter:
+        meter.press_button(button, n)
+
+
+def getvar(port, var):
+    """return the requested type of mode/status data
+
+    port may be a serial port name or an open PCE174 session.
+    """
+
+    with session(port) as meter:
+        return meter.getvar(var)
 
 
 def setvar(port, var, value):
-    "set variable var to value"
-
-    validvars = {
-            'mode':     ('normal', 'rel', 'min', 'max', 'pmin', 'pmax'), 
-            'hold':     ('cont', 'hold'),
-            'range':    {
-                'lux':  ('400k', '400', '4k', '40k'), 
-                'fc':   ('40k', '40', '400', '4k')
-                },
-            'unit':     ('lux', 'fc'), 
-            'apo':      ('on', 'off'), 
-            'view':     ('time', 'day', 'year', 'sampling')
-            }
+    """set variable var to value
+
+    port may be a serial port name or an open PCE174 session.
+    """
+
+    with session(port) as meter:
+        meter.setvar(var, value)
 
-    if var in validvars:
-        stat = read_data(port=port, datatype='live')
-        time.sleep(.25)
-        
-        if value==stat[var]:
-            pass # No change of settings necessary
-        elif var == "unit":
-            press_button(port, "units")
-        elif var == "range":
-            if value not in validvars['range'][stat["unit"]]:
-                sys.exit("`{}` is not a valid range for unit `{}`".format(value, stat["unit"]))
-            press_button(port, "range", pressdist(stat["range"], value, validvars["range"][stat["unit"]]))
-            time.sleep(.25)
-        elif var == "mode":
-            if stat["mode"] != "normal":
-                press_button(port, "rel", 2)
-            if value == "rel":
-                press_button(port, "rel", 1)
-            if value == "max":
-                press_button(port, "max", 1)
-            if value == "min":
-                press_button(port, "min", 2)
-            if value == "pmax":
-                press_button(port, "peak", 1)
-            if value == "pmin":
-                press_button(port, "peak", 2)
-        elif var == "hold":
-            press_button(port, "hold")
-        # XXX This does not seem to work
-#        elif var == "apo":
-#            if value == "on":
-#                send_cmd(port, 0x7b)
-#            elif value == "off":
-#                send_cmd(port, 0x7c)
-#            return  # apo is automatically turned off by getting live data?!? So we cannot test for success
-        elif var == "view":
-            print(stat["view"], value)
-            print ("dist:", pressdist(stat["view"], value, validvars["view"]))
-            press_button(port, "RIGHT", pressdist(stat["view"], value, validvars["view"]))
-            
-        # test success
-        time.sleep(.25)
-        newval = getvar(port, var)
-        if newval != value:
-            sys.exit("Error: Failed to set `{}` to `{}`".format(var, value))
-    else:
-        sys.exit("{} is not a valid argument to `set`".format(var))
    
+def setvars(port, settings):
+    """set several variables at once (see PCE174.setvars)
+
+    port may be a serial port name or an open PCE174 session.
+    """
+
+    with session(port) as meter:
+        meter.setvars(settings)
+
+
 def pressdist(v1, v2, l):
     "return button press distance between values v1 and v2 in list l"
 
@@ -208,35 +972,26 @@ def pressdist(v1, v2, l):
 
 
 
-def log_live_data(port, outformat, sampleno, interval, sep=","):
+def log_live_data(port, outformat, sampleno, interval, sep=",", window=None, threshold=None, db=None):
     """Log live data (tethered logging)
+
+    port may be a serial port name or an open PCE174 session.
+    See PCE174.log_live_data for details.
     """
 
-    if sampleno <0:
-        sampleno = float('Inf')
-    i = 0
-    while True:
-        dat = read_data(port=port, datatype="live", outformat=outformat, sep=sep, header=i==0)
-        dat = str(dat) + "\n"
-        dat = dat.encode("utf-8")
-        sys.stdout.buffer.write(bytes(dat))
-        sys.stdout.flush()
-        i += 1
-        if sampleno >0:
-            if i >= sampleno:
-                break
-        time.sleep(interval)
-    return
+    with session(port) as meter:
+        return meter.log_live_data(outformat, sampleno, interval, sep=sep, window=window, threshold=threshold, db=db)
 
 
 
-def read_data(port, datatype, outformat="repr", sep=",", fromfile="", header=False):
+def read_data(port, datatype, outformat="repr", sep=",", fromfile="", header=False, groups=None, jobs=1, out=None, cache=None):
     """
     read data from the instrument and return the results in the specified outformat
 
     port:       serial port to use or filename
                 typically something like /dev/ttyUSB0 or com1
                 if fromfile==True this is the filenem to read from
+                May also be an open PCE174 session.
     datatype:   {live|saved|logger}
                 live: current value as displayed
                 saved: manually saved data (registers 1-99)
@@ -244,25 +999,19 @@ def read_data(port, datatype, outformat="repr", sep=",", fromfile="", header=Fal
     outformat:  {csv|repr|construct|hex|raw}
     fromfile:   {True|False}
                 if True, port is interpreted as a file name to read raw data from
+    groups:     list of logging group numbers to decode (logger only, default: all)
+    jobs:       number of processes for decoding logger groups in parallel
+    out:        binary file to write csv output to in chunks instead of
+                returning it
+    cache:      LoggerCache, only logger data that is not in the cache is
+                returned (see new_logger_data)
     """
     
-    cmd = {
-            "live":     0x11,
-            "saved":    0x12,
-            "logger":   0x13
-            }
-
-    dat = None
-    if datatype not in cmd.keys():
-        sys.exit("Unknown data type '{}'".format(datatype))
-    else:
-        if len(fromfile)>0:
-            infile = open(fromfile, "rb")
-            dat = infile.read()
-            infile.close()
-        dat = send_cmd(port, cmd[datatype], read=True) 
-        dat = decode_blob(dat, datatype, outformat, sep, header=header)
-    return dat
+    with session(port) as meter:
+        return meter.read_data(
+            datatype, outformat=outformat, sep=sep, fromfile=fromfile, header=header,
+            groups=groups, jobs=jobs, out=out, cache=cache,
+        )
 
 
 
@@ -270,6 +1019,7 @@ def send_cmd(port, cmd, read=False, timeout=0.1):
     """Send command byte to instrument
 
     port     : string indicating the serial port to use. E.g. /dev/ttyUSB0
+               or an open PCE174 session
     cmd      : a single byte to be sent
     read     : If True try to read data from the instrument after sending command
     timeout  : Rimeout for serial communication
@@ -279,25 +1029,513 @@ def send_cmd(port, cmd, read=False, timeout=0.1):
     reverse engineer/use undocumented functions of the instrument.
     """
 
-    iface = serial.Serial(
-        port=port, baudrate=9600, bytesize=8, parity="N", stopbits=1, timeout=timeout
-    )
+    with session(port, timeout=timeout) as meter:
+        return meter.send_cmd(cmd, read=read)
 
-    hello = b"\x87\x83"  # command prefix
-    msg = hello + bytes([cmd])
-    iface.write(msg)
 
-    blob = b""
-    if read:
-        while True:
-            byte = iface.read(1)
-            if len(byte) > 0:
-                blob += byte
-            else:
+def log_multi(ports, outformat, sampleno, interval, sep=",", decoder=None, capture=None):
+    """Log live data from several instruments concurrently (tethered logging)
+
+    Each port is polled by its own thread with its own session, so a slow or
+    unresponsive instrument does not delay the others. All ports sample on a
+    shared grid of deadlines (see SampleClock). Output is one merged stream in
+    which every record is tagged with the port and the number of the sampling
+    slot it belongs to.
+
+    Timing summaries for each port are written to STDERR at the end.
+
+    capture optionally is a WireCapture that records the transfers of all
+    ports.
+    """
+
+    if sampleno <= 0:
+        sampleno = float('Inf')
+    start = time.monotonic()
+    lock = threading.Lock()
+    stop = threading.Event()
+    clocks = {port: SampleClock(interval, start=start) for port in ports}
+
+    def write(dat):
+        with lock:
+            sys.stdout.buffer.write(dat.encode("utf-8"))
+            sys.stdout.flush()
+
+    def worker(port):
+        clock = clocks[port]
+        try:
+            with PCE174(port, decoder=decoder, capture=capture) as meter:
+                meter.open()
+                while clock.samples < sampleno and not stop.is_set():
+                    skipped = clock.wait()
+                    if skipped:
+                        sys.stderr.write("{}: Skipped {} sampling slot(s)\n".format(port, skipped))
+                    dat = meter.read_data(datatype="live", outformat="repr" if outformat in ("csv", "repr") else outformat)
+                    if outformat == "csv":
+                        dat = sep.join((port, str(clock.slot), live_data2csv(dat, sep, header=False)))
+                    elif outformat == "repr":
+                        dat = dict(port=port, slot=clock.slot, **dat)
+                    elif outformat == "hex":
+                        dat = sep.join((port, str(clock.slot), dat.decode("ascii")))
+                    else:
+                        dat = sep.join((port, str(clock.slot), str(dat)))
+                    write(str(dat) + "\n")
+        except Exception as e:
+            sys.stderr.write("{}: {}\n".format(port, e))
+
+    if outformat == "csv":
+        write(sep.join(("port", "slot") + LIVE_COLUMNS) + "\n")
+
+    threads = [threading.Thread(target=worker, args=(port,), daemon=True) for port in ports]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.1)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for port in ports:
+            sys.stderr.write("{}: {}\n".format(port, clocks[port].report()))
+
+    return {port: clocks[port].summary() for port in ports}
+
+
+def default_socket_path(port):
+    "return the default path of the daemon socket for port"
+
+    return os.path.join(tempfile.gettempdir(), "pce174-{}.sock".format(os.path.basename(port)))
+
+
+def serve(port, interval=1, socket_path=None, decoder=None, capture=None):
+    """Run a daemon that owns the port and serves live data to local clients
+
+    The daemon keeps one session open, polls live data every `interval`
+    seconds (see SampleClock) and caches the latest reading. Any number of
+    clients can fetch it from a Unix domain socket (default:
+    default_socket_path(port)) without touching the serial port.
+
+    Protocol: the client sends the line `live` and receives one line of JSON
+    with the keys
+
+    Key     | Description
+    --------|------------------------------------------------------
+    time    | host time of the reading (seconds since the epoch)
+    record  | the live data dict as returned by process_live_data
+    raw     | the live data blob in hex
+
+    Unknown requests are answered with {"error": "..."}.
+
+    capture optionally is a WireCapture that records the transfers of the
+    port.
+    """
+
+    socket_path = socket_path or default_socket_path(port)
+    meter = PCE174(port, decoder=decoder, capture=capture)
+    cache = {}  # replaced as a whole by the poller, never modified in place
+    stop = threading.Event()
+
+    def poll():
+        blob = meter.send_cmd(0x11, read=True)
+        record = decode_blob(blob, "live", "repr", ",", decoder=decoder)
+        reply = {"time": time.time(), "record": record.asdict(), "raw": blob.hex()}
+        cache["live"] = (json.dumps(reply) + "\n").encode("utf-8")
+
+    def poller():
+        clock = SampleClock(interval)
+        clock.wait()  # slot 0 was read before the server started
+        while not stop.is_set():
+            clock.wait()
+            try:
+                poll()
+            except Exception as e:
+                sys.stderr.write("{}\n".format(e))
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                request = line.strip().decode("utf-8", "replace")
+                reply = cache.get(request)
+                if reply is None:
+                    reply = (json.dumps({"error": "Unknown request `{}`".format(request)}) + "\n").encode("utf-8")
+                self.wfile.write(reply)
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        if daemon_request(socket_path) is not None:
+            sys.exit("A daemon is already listening on {}".format(socket_path))
+        os.unlink(socket_path)  # stale socket
+
+    with meter:
+        poll()
+        thread = threading.Thread(target=poller, daemon=True)
+        thread.start()
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        sys.stderr.write("Serving {} on {}\n".format(port, socket_path))
+        # make sure the socket is removed when we are terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            server.serve_forever()
+        finally:
+            stop.set()
+            server.server_close()
+            os.unlink(socket_path)
+            thread.join()
+
+
+def daemon_request(socket_path, request="live", timeout=1.0):
+    """Send request to a daemon started with `serve` and return the decoded reply
+
+    Returns None if no daemon is listening on socket_path.
+    """
+
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(request.encode("utf-8") + b"\n")
+        reply = sock.makefile("rb").readline()
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    if not reply:
+        return None
+    return json.loads(reply)
+
+
+class RunningStats:
+    """Running count, min, max, mean and standard deviation of a series
+
+    Uses Welford's algorithm, so memory use is constant no matter how many
+    values are added.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0
+
+    def add(self, x):
+        "add value x"
+
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    @property
+    def stddev(self):
+        "sample standard deviation (0 for less than 2 values)"
+
+        if self.count < 2:
+            return 0.0
+        return (self._m2 / (self.count - 1)) ** 0.5
+
+
+# csv columns of aggregated live data (see WindowStats)
+AGGREGATE_COLUMNS = ("date", "time", "end", "count", "min", "max", "mean", "stddev", "unit")
+
+
+class WindowStats:
+    """Aggregate live data records over fixed time windows
+
+    Records are added with their (monotonic) time. Windows are `window`
+    seconds long and aligned to time 0. When a record falls into a new window
+    or its unit differs, the statistics of the finished window are returned.
+    Only the running statistics of the current window are kept, so memory use
+    is constant.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.index = None
+        self.stats = None
+        self.first = self.last = None
+        self.min = self.max = None
+        self.exponent = None
+
+    def add(self, t, rec):
+        """add record rec taken at time t [s]
+
+        returns the result of the window that was finished by rec or None
+        """
+
+        index = int(t // self.window)
+        result = None
+        if self.stats is not None and (index != self.index or rec["unit"] != self.first["unit"]):
+            result = self.result()
+            self.stats = None
+        if self.stats is None:
+            self.index = index
+            self.stats = RunningStats()
+            self.first = self.min = self.max = rec
+            self.exponent = rec.exponent
+
+        self.stats.add(rec["value"])
+        self.last = rec
+        if rec["value"] < self.min["value"]:
+            self.min = rec
+        if rec["value"] > self.max["value"]:
+            self.max = rec
+        self.exponent = min(self.exponent, rec.exponent)
+        return result
+
+    def result(self):
+        "return the statistics of the current window as a dict or None if it is empty"
+
+        if self.stats is None:
+            return None
+        # one digit more than the finest range resolution
+        decimals = max(0, -self.exponent) + 1
+        return OrderedDict((
+            ("date", self.first["date"]),
+            ("time", self.first["time"]),
+            ("end", self.last["time"]),
+            ("count", self.stats.count),
+            ("min", format_fixed(self.min.counts, self.min.exponent)),
+            ("max", format_fixed(self.max.counts, self.max.exponent)),
+            ("mean", "{:.{}f}".format(self.stats.mean, decimals)),
+            ("stddev", "{:.{}f}".format(self.stats.stddev, decimals)),
+            ("unit", self.first["unit"]),
+        ))
+
+
+class SampleClock:
+    """Deadline scheduler for tethered logging
+
+    Sampling slots lie on a fixed grid of monotonic deadlines (start + k *
+    interval), so the time spent reading and writing a sample does not shift
+    later samples. If a sample takes longer than an interval, the slots that
+    have passed are skipped instead of shifting the whole series.
+
+    An interval <= 0 means sampling as fast as the instrument answers.
+
+    start optionally sets the monotonic time of slot 0, e.g. to share the
+    grid between several clocks. By default the grid starts with the first
+    sample.
+    """
+
+    def __init__(self, interval, start=None):
+        self.interval = interval
+        self.start = start
+        self.slot = 0
+        self.samples = 0
+        self.missed = 0
+        self.last = None
+        self.lateness = RunningStats()  # sample time - deadline
+        self.periods = RunningStats()   # time between samples
+
+    def wait(self):
+        """wait for the next sampling slot
+
+        returns the number of slots that were skipped because they had
+        already passed
+        """
+
+        now = time.monotonic()
+        skipped = 0
+        if self.start is None:
+            self.start = now
+        if self.last is not None:
+            self.slot += 1
+        if self.interval > 0:
+            skipped = max(0, int((now - self.start) / self.interval) - self.slot)
+            self.slot += skipped
+            self.missed += skipped
+            deadline = self.start + self.slot * self.interval
+            if deadline > now:
+                time.sleep(deadline - now)
+        else:
+            deadline = now
+
+        now = time.monotonic()
+        self.lateness.add(now - deadline)
+        if self.last is not None:
+            self.periods.add(now - self.last)
+        self.last = now
+        self.samples += 1
+
+        return skipped
+
+    def summary(self):
+        "return a dict with achieved rate and timing statistics"
+
+        elapsed = self.last - self.start if self.samples else 0.0
+        return {
+            "samples": self.samples,
+            "elapsed": elapsed,
+            "rate": (self.samples - 1) / elapsed if elapsed > 0 else 0.0,
+            "missed": self.missed,
+            "lateness_mean": self.lateness.mean,
+            "lateness_max": self.lateness.max or 0.0,
+            "period_mean": self.periods.mean,
+            "period_stddev": self.periods.stddev,
+        }
+
+    def report(self):
+        "return a human readable summary"
+
+        return (
+            "{samples} samples in {elapsed:.3f} s ({rate:.3f} Hz), {missed} missed slots, "
+            "lateness mean {0:.1f} ms max {1:.1f} ms, period mean {2:.1f} ms stddev {3:.1f} ms"
+        ).format(
+            *(1000 * x for x in (
+                self.lateness.mean, self.lateness.max or 0.0,
+                self.periods.mean, self.periods.stddev,
+            )),
+            **self.summary()
+        )
+
+
+class LogHistogram:
+    """Histogram of durations in logarithmic buckets
+
+    Memory use is constant no matter how many values are added, so it can
+    run for weeks. Buckets span BUCKETS_PER_DECADE steps per factor of 10
+    from MIN to MIN * 10**DECADES seconds, so quantiles are accurate to
+    about 3%. count, min and max are exact.
+    """
+
+    BUCKETS_PER_DECADE = 40
+    MIN = 1e-6
+    DECADES = 9
+
+    def __init__(self):
+        # bucket 0 holds values <= MIN, the last one values beyond the range
+        self.buckets = [0] * (self.BUCKETS_PER_DECADE * self.DECADES + 2)
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        "add value [s]"
+
+        if value <= self.MIN:
+            i = 0
+        else:
+            i = min(int(math.log10(value / self.MIN) * self.BUCKETS_PER_DECADE) + 1, len(self.buckets) - 1)
+        self.buckets[i] += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        "return the approximate q quantile (0 <= q <= 1), None if there are no values"
+
+        if not self.count:
+            return None
+        rank = int(q * (self.count - 1))
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen > rank:
                 break
-    iface.close()
+        # geometric center of the bucket
+        value = self.MIN * 10 ** ((i - 0.5) / self.BUCKETS_PER_DECADE) if i else self.MIN
+        return min(max(value, self.min), self.max)
 
-    return blob
+
+class PhaseTimer:
+    """Per-command timing of serial communication, decoding and output
+
+    A command starts with `begin` (called by send_cmd) and the time spent in
+    each of its phases is measured with `phase`:
+
+    open       : opening the serial port
+    write      : writing the command bytes
+    first_byte : waiting for the first bytes of the response
+    transfer   : reading the rest of the response
+    idle       : waiting for the line to become idle after unknown responses
+    decode     : decode_blob
+    output     : writing the result to STDOUT
+
+    The durations of each phase are collected in a LogHistogram, so memory
+    use does not grow during long sessions.
+
+    If sidefile (a file opened for writing) is given, each command is written
+    to it as one line of JSON with the monotonic start time `t` and the
+    duration of its phases [s] once the next command begins or `finish` is
+    called.
+    """
+
+    PHASES = ("open", "write", "first_byte", "transfer", "idle", "decode", "output")
+
+    def __init__(self, sidefile=None):
+        self.sidefile = sidefile
+        self.times = {phase: LogHistogram() for phase in self.PHASES}
+        self.command = None
+        self.start = None
+        self.current = {}
+        # reentrant, report() may run in a signal handler while the main
+        # thread holds the lock
+        self.lock = threading.RLock()
+
+    def begin(self, command):
+        "finish the current command and start timing command"
+
+        self.finish()
+        self.command = command
+        self.start = time.monotonic()
+
+    def finish(self):
+        "finish the current command"
+
+        with self.lock:
+            if self.command is not None and self.sidefile is not None:
+                self.sidefile.write(json.dumps(dict(command=self.command, t=self.start, **self.current)) + "\n")
+                self.sidefile.flush()
+            self.command = None
+            self.current = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        "context manager that adds the time spent in its block to phase name"
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.times[name].add(elapsed)
+                self.current[name] = self.current.get(name, 0.0) + elapsed
+
+    def summary(self):
+        "return a dict with count, p50, p95 and max [s] of each phase that occurred"
+
+        stats = OrderedDict()
+        with self.lock:
+            for name in self.PHASES:
+                times = self.times[name]
+                if times.count:
+                    stats[name] = {
+                        "count": times.count,
+                        "p50": times.quantile(0.5),
+                        "p95": times.quantile(0.95),
+                        "max": times.max,
+                    }
+        return stats
+
+    def report(self):
+        "return a human readable summary"
+
+        lines = ["{:<10} {:>7} {:>9} {:>9} {:>9}".format("phase", "count", "p50 [ms]", "p95 [ms]", "max [ms]")]
+        for name, stat in self.summary().items():
+            lines.append("{:<10} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                name, stat["count"], 1000 * stat["p50"], 1000 * stat["p95"], 1000 * stat["max"]
+            ))
+        return "\n".join(lines)
 
 
 def bcd2int(dat):
@@ -318,15 +1556,43 @@ def bcd2int(dat):
     return ret
 
 
-def decode_blob(blob, cmd, outformat, sep, header=True):
+def decode_blob(blob, cmd, outformat, sep, header=True, decoder=None, invalid="raise", groups=None, jobs=1, out=None):
     """return decoded data
 
     Central dispatch for the different parsing, processing and csv translation steps
+
+    decoder selects the backend used for the `repr` and `csv` formats:
+    `construct` parses the blob with construct and processes the container,
+    `fast` decodes the blob directly with precomputed struct layouts. Both
+    return identical records. `numpy` writes logger csv straight from a
+    numpy_logger_data array and otherwise behaves like `fast`.
+    Defaults to DEFAULT_DECODER.
+
+    invalid decides how saved data registers with invalid data are handled
+    (see saved_batch_records). Unless it is `raise`, saved data is always
+    decoded with the fast backend.
+
+    groups optionally restricts logger data to the given group numbers and
+    jobs > 1 decodes the logger groups in parallel with the fast and numpy
+    backends (see decode_logger_parallel).
+
+    If out (a binary file) is given, `csv` output is written to it in chunks
+    (see write_lines) instead of being returned as one string, and None is
+    returned.
     """
 
+    decoder = decoder or DEFAULT_DECODER
+    if decoder not in DECODERS:
+        raise Exception("Unknown decoder `{}`".format(decoder))
+    # the construct backend validates the blob for all formats
+    parse = decoder == "construct" or outformat == "construct"
+    if invalid not in INVALID_MODES:
+        raise Exception("Unknown mode for invalid data `{}`".format(invalid))
+
     dat = None
     if cmd == "live":
-        dat = parse_live_data(blob) # blob -> construct
+        if parse:
+            dat = parse_live_data(blob) # blob -> construct
         if outformat == "raw":
             dat = blob
         elif outformat == "hex":
@@ -334,14 +1600,17 @@ def decode_blob(blob, cmd, outformat, sep, header=True):
         elif outformat == "construct":
             pass
         elif outformat == "repr":
-            dat = process_live_data(dat) # blob -> repr
+            dat = process_live_data(dat) if parse else fast_live_data(blob) # blob -> repr
         elif outformat == "csv":
-            dat = process_live_data(dat) # blob -> repr
-            dat = live_data2csv(dat, sep, header=header) # repr -> csv
+            dat = process_live_data(dat) if parse else fast_live_data(blob) # blob -> repr
+            dat = _csv_output(live_csv_lines(dat, sep, header=header), out) # repr -> csv
         else:
             raise Exception("Unknown format `{}`".format(outformat))
     elif cmd == "saved":
-        dat = parse_saved_data(blob)
+        if invalid != "raise" and outformat != "construct":
+            parse = False
+        if parse:
+            dat = parse_saved_data(blob)
         if outformat == "raw":
             dat = blob
         elif outformat == "hex":
@@ -349,25 +1618,37 @@ def decode_blob(blob, cmd, outformat, sep, header=True):
         elif outformat == "construct":
             pass
         elif outformat == "repr":
-            dat = process_saved_data(dat)
+            dat = process_saved_data(dat) if parse else fast_saved_data(blob, invalid)
         elif outformat == "csv":
-            dat = process_saved_data(dat)
-            dat = saved_data2csv(dat, sep)
+            dat = process_saved_data(dat) if parse else fast_saved_data(blob, invalid)
+            dat = _csv_output(saved_csv_lines(dat, sep), out)
         else:
             raise Exception("Unknown format `{}`".format(outformat))
     elif cmd == "logger":
-        dat = parse_logger_data(blob)
+        if parse:
+            dat = parse_logger_data(blob)
         if outformat == "raw":
             dat = blob
         elif outformat == "hex":
             dat = binascii.hexlify(blob)
         elif outformat == "construct":
             pass
-        elif outformat == "repr":
-            dat = process_logger_data(dat)
-        elif outformat == "csv":
-            dat = process_logger_data(dat)
-            dat = logger_data2csv(dat, sep)
+        elif outformat in ("repr", "csv"):
+            if parse:
+                dat = process_logger_data(dat)
+                if groups is not None:
+                    dat = [rec for rec in dat if rec["groupno"] in groups]
+            elif decoder == "numpy" and outformat == "csv":
+                if jobs > 1:
+                    dat = decode_logger_parallel(blob, groups, jobs, decoder="numpy")
+                else:
+                    dat = numpy_logger_data(blob, groups)
+            elif jobs > 1:
+                dat = decode_logger_parallel(blob, groups, jobs)
+            else:
+                dat = fast_logger_data(blob, groups)
+            if outformat == "csv":
+                dat = _csv_output(logger_csv_lines(dat, sep), out)
         else:
             raise Exception("Unknown format `{}`".format(outformat))
     else:
@@ -376,38 +1657,13 @@ def decode_blob(blob, cmd, outformat, sep, header=True):
     return dat
 
 
-def decode_stat0(byte):
-    """return a dict from stat0 byte data
-
-    The return value is a dict with decoded information form the bit field and
-    contains the following keys
-
-    Key    | Description
-    -------|---------------------------------
-    unit   | unit of measurement [lux/fc]
-    range  | measurement range [(40, 400, ... 400k)]
-    apo    | Auto-power-off (on/off)
-    mode   | (normal/Pmin/Pmax/max/min/rel
-    hold   | hold/cont
-    Frange | Factor for decimal point of value
-
-    This is how Frange is intended to be use:
+def _build_stat0(byte):
+    """return a dict from stat0 byte data using plain bit operations
 
-    value = Stat0_sign * (100 * valH + valL) * Frange
+    Returns None if the byte holds an invalid mode.
+    Used to fill STAT0_TABLE at import time.
     """
 
-    Stat0 = BitStruct(
-        "apo" / Flag,
-        "hold" / Flag,
-        "mode" / BitsInteger(3),
-        "unit" / Flag,
-        "range" / BitsInteger(2),
-    )
-    ret = Stat0.parse(bytes([byte]))
-
-    # I know this looks wrong but that's how they implemented the range order...
-    Range = {"lux": ("400k", "400", "4k", "40k"), "fc": ("40k", "40", "400", "4k")}
-
     mode = {
         0b000: "normal",
         0b010: "Pmin",
@@ -420,50 +1676,113 @@ def decode_stat0(byte):
     # factor to set decimal point depending on range
     Frange = {"40": 0.01, "400": 0.1, "4k": 1.0, "40k": 10, "400k": 100}
 
-    ret["unit"] = ("lux", "fc")[ret["unit"]]
-    ret["range"] = Range[ret["unit"]][ret["range"]]
-    ret["apo"] = ("on", "off")[ret["apo"]]
-    ret["mode"] = mode[ret["mode"]]
-    ret["hold"] = ("cont", "hold")[ret["hold"]]
-    ret["Frange"] = Frange[ret["range"]]
+    if byte >> 3 & 0b111 not in mode:
+        return None
 
-    return ret
+    unit = ("lux", "fc")[byte >> 2 & 1]
+    rng = RANGES[unit][byte & 0b11]
 
+    return {
+        "apo": ("on", "off")[byte >> 7 & 1],
+        "hold": ("cont", "hold")[byte >> 6 & 1],
+        "mode": mode[byte >> 3 & 0b111],
+        "unit": unit,
+        "range": rng,
+        "Frange": Frange[rng],
+        "exp": RANGE_EXPONENT[rng],
+    }
 
-def decode_stat1(byte):
-    """return a dict from Stat1 byte data
 
-    The return value is a dict with decoded information form the bit field and
-    contains the following keys
+def _build_stat1(byte):
+    """return a dict from stat1 byte data using plain bit operations
 
-    Key         | Description
-    ------------|---------------------------------
-    power       | ok/low
-    sign        | +1/-1
-    displaymode | time/day/sampling-interval/year
-    memstat     | store/recall/logging/None
+    Used to fill STAT1_TABLE at import time.
     """
 
-    Stat1 = BitStruct(
-        BitsInteger(2),
-        "power" / Flag,
-        "sign" / Flag,
-        "view" / BitsInteger(2),
-        "memstat" / BitsInteger(2),
-    )
+    view = ("time", "day", "sampling", "year")
+    memstat = (None, "store", "recall", "logging")
 
-    ret = Stat1.parse(bytes([byte]))
+    return {
+        "power": ("ok", "low")[byte >> 5 & 1],
+        "sign": (1, -1)[byte >> 4 & 1],
+        "view": view[byte >> 2 & 0b11],
+        "memstat": memstat[byte & 0b11],
+    }
 
-    view = {0b00: "time", 0b01: "day", 0b10: "sampling", 0b11: "year"}
 
-    memstat = {0b00: None, 0b01: "store", 0b10: "recall", 0b11: 'logging'}
+# Lookup tables for all single byte fields, built once at import.
+STAT0_TABLE = tuple(_build_stat0(byte) for byte in range(256))
+STAT1_TABLE = tuple(_build_stat1(byte) for byte in range(256))
+BCD_TABLE = tuple(10 * (byte >> 4) + (byte & 0x0F) for byte in range(256))
+PSEUDO_TETRADES = frozenset(
+    byte for byte in range(256) if byte >> 4 > 9 or byte & 0x0F > 9
+)
 
-    ret["power"] = ("ok", "low")[ret["power"]]
-    ret["sign"] = (1, -1)[ret["sign"]]
-    ret["view"] = view[ret["view"]]
-    ret["memstat"] = memstat[ret["memstat"]]
 
-    return ret
+def bcd_byte(byte):
+    """Return the decimal value of a single BCD encoded byte
+
+    Table driven version of bcd2int for the common single byte case.
+    """
+
+    if byte in PSEUDO_TETRADES:
+        warnings.warn("Pseudo-tetrade encountered in BCD conversion.")
+    return BCD_TABLE[byte]
+
+
+def _stat0(byte):
+    """return the shared STAT0_TABLE entry for byte
+
+    Raises ValueError if the byte holds an invalid mode.
+    The returned dict must not be modified.
+    """
+
+    ret = STAT0_TABLE[byte]
+    if ret is None:
+        raise ValueError("Invalid mode in stat0 byte 0x{:02x}".format(byte))
+    return ret
+
+
+def decode_stat0(byte):
+    """return a dict from stat0 byte data
+
+    The return value is a dict with decoded information form the bit field and
+    contains the following keys
+
+    Key    | Description
+    -------|---------------------------------
+    unit   | unit of measurement [lux/fc]
+    range  | measurement range [(40, 400, ... 400k)]
+    apo    | Auto-power-off (on/off)
+    mode   | (normal/Pmin/Pmax/max/min/rel
+    hold   | hold/cont
+    Frange | Factor for decimal point of value
+
+    This is how Frange is intended to be use:
+
+    value = Stat0_sign * (100 * valH + valL) * Frange
+
+    Raises ValueError if the byte holds an invalid mode.
+    """
+
+    return dict(_stat0(byte))
+
+
+def decode_stat1(byte):
+    """return a dict from Stat1 byte data
+
+    The return value is a dict with decoded information form the bit field and
+    contains the following keys
+
+    Key         | Description
+    ------------|---------------------------------
+    power       | ok/low
+    sign        | +1/-1
+    displaymode | time/day/sampling-interval/year
+    memstat     | store/recall/logging/None
+    """
+
+    return dict(STAT1_TABLE[byte])
 
 
 def parse_live_data(blob):
@@ -565,16 +1884,217 @@ def parse_logger_data(blob):
     return dat
 
 
+class Record:
+    """Base class of the decoded data records
+
+    Records store the raw counts, the shared status table entries and the
+    date/time fields as numbers in __slots__. Derived values like `value` or
+    `date` are computed when they are accessed. Records behave like read-only
+    dicts with the keys in FIELDS, i.e. rec["value"], rec.keys(), dict(rec)
+    and "{unit}".format_map(rec) work. They compare equal to dicts with the
+    same content and their repr is that of the dict.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def keys(self):
+        return self.FIELDS
+
+    def values(self):
+        return [getattr(self, key) for key in self.FIELDS]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.FIELDS]
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def asdict(self):
+        "return the record as a dict"
+
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.asdict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.asdict())
+
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    # fields that are formatted as exact decimals by csv_fields and the
+    # attribute holding their counts
+    EXACT = {"value": "counts"}
+
+    def csv_fields(self, columns):
+        "return the given fields as strings, values as exact decimals (see format_fixed)"
+
+        return [
+            format_fixed(getattr(self, self.EXACT[col]), self.exponent) if col in self.EXACT
+            else str(getattr(self, col))
+            for col in columns
+        ]
+
+    exponent = property(lambda self: self._stat0["exp"], doc="decimal exponent of the range")
+
+    # status fields shared by all record types
+    unit = property(lambda self: self._stat0["unit"])
+    range = property(lambda self: self._stat0["range"])
+    mode = property(lambda self: self._stat0["mode"])
+    hold = property(lambda self: self._stat0["hold"])
+    apo = property(lambda self: self._stat0["apo"])
+
+
+class LiveRecord(Record):
+    """Live data record (see process_live_data for the keys)
+
+    clock is the tuple (year, month, day, hour, minute, second) with 2 digit
+    years, counts and rawcounts the readings as 100 * valH + valL and stat0
+    and stat1 entries of STAT0_TABLE and STAT1_TABLE.
+    """
+
+    __slots__ = ("_clock", "weekday", "_counts", "_rawcounts", "_stat0", "_stat1", "mem_no", "read_no")
+    FIELDS = (
+        "date", "weekday", "time", "value", "rawvalue", "unit", "range", "mode", "hold", "apo",
+        "power", "view", "memstat", "mem_no", "read_no",
+    )
+
+    EXACT = {"value": "counts", "rawvalue": "rawcounts"}
+
+    def __init__(self, clock, weekday, counts, rawcounts, stat0, stat1, mem_no, read_no):
+        self._clock = clock
+        self.weekday = weekday
+        self._counts = counts
+        self._rawcounts = rawcounts
+        self._stat0 = stat0
+        self._stat1 = stat1
+        self.mem_no = mem_no
+        self.read_no = read_no
+
+    date = property(lambda self: "20%2.2i-%2.2i-%2.2i" % self._clock[:3])
+    time = property(lambda self: "%2.2i:%2.2i:%2.2i" % self._clock[3:])
+    counts = property(lambda self: self._stat1["sign"] * self._counts, doc="signed counts, value = counts * 10**exponent")
+    rawcounts = property(lambda self: self._rawcounts)
+    value = property(lambda self: scale(self.counts, self._stat0["exp"]))
+    rawvalue = property(lambda self: scale(self._rawcounts, self._stat0["exp"]))
+    power = property(lambda self: self._stat1["power"])
+    view = property(lambda self: self._stat1["view"])
+    memstat = property(lambda self: self._stat1["memstat"])
+
+
+class SavedRecord(Record):
+    """Saved data record (see process_saved_data for the keys)
+
+    Like LiveRecord. date and time are datetime.date and datetime.time
+    objects unless exact is True, in which case they are strings of the
+    stored (possibly invalid) values.
+    """
+
+    __slots__ = ("pos", "_clock", "weekday", "_counts", "_stat0", "_stat1", "_exact")
+    FIELDS = (
+        "pos", "date", "weekday", "time", "value", "unit", "range", "mode", "hold", "apo",
+        "power", "view", "memstat",
+    )
+
+    def __init__(self, pos, clock, weekday, counts, stat0, stat1, exact=False):
+        self.pos = pos
+        self._clock = clock
+        self.weekday = weekday
+        self._counts = counts
+        self._stat0 = stat0
+        self._stat1 = stat1
+        self._exact = exact
+
+    @property
+    def date(self):
+        year, month, day = self._clock[:3]
+        if self._exact:
+            return "20%2.2i-%2.2i-%2.2i" % (year, month, day)
+        return datetime.date(2000 + year, month, day)
+
+    @property
+    def time(self):
+        if self._exact:
+            return "%2.2i:%2.2i:%2.2i" % self._clock[3:]
+        return datetime.time(*self._clock[3:])
+
+    counts = property(lambda self: self._stat1["sign"] * self._counts, doc="signed counts, value = counts * 10**exponent")
+    value = property(lambda self: scale(self.counts, self._stat0["exp"]))
+    power = property(lambda self: self._stat1["power"])
+    view = property(lambda self: self._stat1["view"])
+    memstat = property(lambda self: self._stat1["memstat"])
+
+
+class LoggerRecord(Record):
+    """Logger data record (see process_logger_data for the keys)
+
+    group is the LoggerGroup of the record, which is shared by all records of
+    the group, id the number of the record within the group. Date and time
+    are computed from the start of the group.
+    """
+
+    __slots__ = ("_group", "id", "_counts", "_stat0")
+    FIELDS = (
+        "groupno", "id", "sampling", "date", "weekday", "time", "value", "unit", "range", "mode",
+        "hold", "apo",
+    )
+
+    def __init__(self, group, id, counts, stat0):
+        self._group = group
+        self.id = id
+        self._counts = counts
+        self._stat0 = stat0
+
+    groupno = property(lambda self: self._group.groupno)
+    sampling = property(lambda self: self._group.sampling)
+    weekday = property(lambda self: self._group.weekday)
+    counts = property(lambda self: self._counts, doc="value = counts * 10**exponent")
+    value = property(lambda self: scale(self._counts, self._stat0["exp"]))
+
+    @property
+    def timestamp(self):
+        "datetime of the record"
+
+        return self._group.start + datetime.timedelta(seconds=self.id * self._group.sampling)
+
+    date = property(lambda self: self.timestamp.date())
+    time = property(lambda self: self.timestamp.time())
+
+
 def process_live_data(rec):
-    """Return live data dict from construct container
+    """Return live data record from construct container
 
-    Accepts a construct container object and returns a dict
+    Accepts a construct container object and returns a LiveRecord
     representing the measurement.
 
     Processing comprises the assembly of common time and date formats as well
     as turning bit fields into human readable values.
 
-    Measurement records are dicts with the following keys:
+    Measurement records behave like dicts with the following keys:
 
     Key       | Description
     ----------|-----------------------------------------------
@@ -597,43 +2117,31 @@ def process_live_data(rec):
 
     # bcd decoding
     for key in ["year", "weekday", "month", "day", "hour", "minute", "second"]:
-        rec[key] = bcd2int(rec[key])
-
-    stat0 = decode_stat0(rec["stat0"])
-    stat1 = decode_stat1(rec["stat1"])
+        rec[key] = bcd_byte(rec[key])
 
     # reassemble the record in a more practical format
-    rec = {
-        "date": "20%2.2i-%2.2i-%2.2i" % (rec["year"], rec["month"], rec["day"]),
-        "weekday": rec["weekday"],
-        "time": "%2.2i:%2.2i:%2.2i" % (rec["hour"], rec["minute"], rec["second"]),
-        "value": stat1["sign"] * (100 * rec["dat1H"] + rec["dat1L"]) * stat0["Frange"],
-        "rawvalue": (100 * rec["dat0H"] + rec["dat0L"]) * stat0["Frange"],
-        "unit": stat0["unit"],
-        "range": stat0["range"],
-        "mode": stat0["mode"],
-        "hold": stat0["hold"],
-        "apo": stat0["apo"],
-        "power": stat1["power"],
-        "view": stat1["view"],
-        "memstat": stat1["memstat"],
-        "mem_no": rec["mem_no"],
-        "read_no": rec["read_no"],
-    }
-
-    return rec
+    return LiveRecord(
+        (rec["year"], rec["month"], rec["day"], rec["hour"], rec["minute"], rec["second"]),
+        rec["weekday"],
+        100 * rec["dat1H"] + rec["dat1L"],
+        100 * rec["dat0H"] + rec["dat0L"],
+        _stat0(rec["stat0"]),
+        STAT1_TABLE[rec["stat1"]],
+        rec["mem_no"],
+        rec["read_no"],
+    )
 
 
 def process_saved_data(dat):
-    """Return saved data dict from construct container
+    """Return saved data records from construct container
 
-    Accepts a construct container object and returns a list of dicts
-    Each dict represents one saved measurement.
+    Accepts a construct container object and returns a list of SavedRecords.
+    Each record represents one saved measurement.
 
     Processing comprises the assembly of common time and date formats as well as
     turning bit fields into human readable values.
 
-    Saved data records are dicts with the folloing keys:
+    Saved data records behave like dicts with the folloing keys:
 
     Key       | Description
     ----------|-----------------------------------------------
@@ -658,38 +2166,21 @@ def process_saved_data(dat):
             break
         # bcd decoding
         for key in ["year", "weekday", "month", "day", "hour", "minute", "second"]:
-            rec[key] = bcd2int(rec[key])
+            rec[key] = bcd_byte(rec[key])
 
-        stat0 = decode_stat0(rec["stat0"])
-        stat1 = decode_stat1(rec["stat1"])
-
-        dtime = datetime.datetime(
-            2000 + rec["year"],
-            rec["month"],
-            rec["day"],
-            rec["hour"],
-            rec["minute"],
-            rec["second"],
-        )
+        clock = (rec["year"], rec["month"], rec["day"], rec["hour"], rec["minute"], rec["second"])
+        # raises ValueError for invalid dates and times
+        datetime.datetime(2000 + clock[0], *clock[1:])
 
         # reassemble the record in a more practical format
-        rec = {
-            "pos": rec["pos"],
-            "date": dtime.date(),
-            "weekday": rec["weekday"],
-            "time": dtime.time(),
-            "value": stat1["sign"] * (100 * rec["datH"] + rec["datL"]) * stat0["Frange"],
-            "unit": stat0["unit"],
-            "range": stat0["range"],
-            "mode": stat0["mode"],
-            "hold": stat0["hold"],
-            "apo": stat0["apo"],
-            "power": stat1["power"],
-            "view": stat1["view"],
-            "memstat": stat1["memstat"],
-        }
-
-        dat2.append(rec)
+        dat2.append(SavedRecord(
+            rec["pos"],
+            clock,
+            rec["weekday"],
+            100 * rec["datH"] + rec["datL"],
+            _stat0(rec["stat0"]),
+            STAT1_TABLE[rec["stat1"]],
+        ))
 
     return dat2
 
@@ -699,7 +2190,8 @@ def process_logger_data(dat):
 
     Accepts a construct container object and returns a list of logging groups.
 
-    Each group is a list of data points. Datapoints are dicts with the following keys:
+    Each group is a list of data points. Datapoints are LoggerRecords that
+    behave like dicts with the following keys:
 
     Key       | Description
     ----------|-------------------------------------------------
@@ -722,7 +2214,7 @@ def process_logger_data(dat):
     for group in dat["groups"]:
         # bcd decoding
         for key in ["year", "weekday", "month", "day", "hour", "minute", "second"]:
-            group[key] = bcd2int(group[key])
+            group[key] = bcd_byte(group[key])
 
         dtime = datetime.datetime(
             2000 + group["year"],
@@ -733,114 +2225,1807 @@ def process_logger_data(dat):
             group["second"],
         )
 
+        entry = LoggerGroup(
+            group["groupno"], None, None, len(group["data"]), group["sampling"], dtime, group["weekday"]
+        )
         for i, rec in enumerate(group["data"]):
+            # reassemble the record in a more practical format
+            logger.append(LoggerRecord(entry, i, 100 * rec["datH"] + rec["datL"], _stat0(rec["stat0"])))
 
-            stat0 = decode_stat0(rec["stat0"])
+    return logger
 
-            # reassemble the record in a more practical format
-            rec = {
-                "groupno": group["groupno"],
-                "id": i,
-                "sampling": group["sampling"],
-                "date": dtime.date(),
-                "weekday": group["weekday"],
-                "time": dtime.time(),
-                #'value'    : stat1['sign'] * (100*rec['datH'] + rec['datL']) * stat0['Frange'],
-                "value": (100 * rec["datH"] + rec["datL"]) * stat0["Frange"],
-                "unit": stat0["unit"],
-                "range": stat0["range"],
-                "mode": stat0["mode"],
-                "hold": stat0["hold"],
-                "apo": stat0["apo"],
+
+# Precomputed layouts for the fast decoder backend
+LIVE_LAYOUT = struct.Struct(">2sx15B")      # magic, reserved, 15 fields
+SAVED_LAYOUT = struct.Struct(">13B")        # one saved data record
+LOGGER_LAYOUT = struct.Struct(">2sBH")      # magic, nogroups, bufsize
+GROUP_LAYOUT = struct.Struct(">2sBB2s7B")   # logging group header
+POINT_LAYOUT = struct.Struct(">3B")         # logging data record
+
+
+def fast_live_data(blob):
+    """Return live data record from a live data blob
+
+    Fast decoder backend: returns the same record as
+    process_live_data(parse_live_data(blob)) without using construct.
+    """
+
+    magic, *fields = LIVE_LAYOUT.unpack_from(blob)
+    if magic != b"\xaa\xdd":
+        raise ValueError("Not a live data blob")
+    (year, weekday, month, day, hour, minute, second,
+        dat0H, dat0L, dat1H, dat1L, stat0, stat1, mem_no, read_no) = fields
+
+    year, weekday, month, day, hour, minute, second = (
+        bcd_byte(x) for x in (year, weekday, month, day, hour, minute, second)
+    )
+
+    return LiveRecord(
+        (year, month, day, hour, minute, second), weekday, 100 * dat1H + dat1L, 100 * dat0H + dat0L,
+        _stat0(stat0), STAT1_TABLE[stat1], mem_no, read_no,
+    )
+
+
+def fast_saved_data(blob, invalid="raise"):
+    """Return list of saved data records from a saved data blob
+
+    Fast decoder backend: returns the same records as
+    process_saved_data(parse_saved_data(blob)) without using construct.
+
+    invalid decides what happens to registers with invalid data (see
+    saved_batch_records).
+    """
+
+    return saved_batch_records(decode_saved_batch(blob), invalid=invalid)
+
+
+# Fields of a saved data record in order
+SAVED_FIELDS = (
+    "reserved", "year", "weekday", "month", "day", "hour", "minute", "second",
+    "pos", "datH", "datL", "stat0", "stat1",
+)
+SAVED_BCD_FIELDS = ("year", "weekday", "month", "day", "hour", "minute", "second")
+
+# bytes.translate tables for decoding whole columns at once
+BCD_BYTES = bytes(BCD_TABLE)
+PSEUDO_BYTES = bytes(byte in PSEUDO_TETRADES for byte in range(256))
+
+# how to handle saved data registers with invalid data
+INVALID_MODES = ("raise", "emit", "clamp", "drop")
+
+
+def decode_saved_batch(blob):
+    """Decode all 99 records of a saved data blob in one pass
+
+    Returns a dict of columns, one per field in SAVED_FIELDS. Each column is a
+    bytes object with one value per register. BCD fields are already decoded.
+    In addition the dict contains
+
+    Key    | Description
+    -------|-------------------------------------------------------
+    used   | number of registers in use (up to the first empty one)
+    valid  | list of bools, True if the date/time and mode of the
+           | register are valid (always False for empty registers)
+
+    The firmware sometimes stores invalid values like seconds > 59, which is
+    what the validity mask is for.
+    """
+
+    if blob[:2] != b"\xbb\x88":
+        raise ValueError("Not a saved data blob")
+    if len(blob) < 2 + 99 * SAVED_LAYOUT.size:
+        raise ValueError("Saved data blob too short")
+
+    records = bytes(blob[2 : 2 + 99 * SAVED_LAYOUT.size])
+    batch = {
+        name: records[i :: SAVED_LAYOUT.size] for i, name in enumerate(SAVED_FIELDS)
+    }
+
+    used = batch["pos"].find(0)
+    batch["used"] = 99 if used < 0 else used
+
+    if any(any(batch[name][: batch["used"]].translate(PSEUDO_BYTES)) for name in SAVED_BCD_FIELDS):
+        warnings.warn("Pseudo-tetrade encountered in BCD conversion.")
+    for name in SAVED_BCD_FIELDS:
+        batch[name] = batch[name].translate(BCD_BYTES)
+
+    batch["valid"] = [
+        _valid_datetime(*fields) and STAT0_TABLE[stat0] is not None
+        for stat0, *fields in zip(
+            batch["stat0"], batch["year"], batch["month"], batch["day"],
+            batch["hour"], batch["minute"], batch["second"],
+        )
+    ]
+
+    return batch
+
+
+def _valid_datetime(year, month, day, hour, minute, second):
+    "return True if the (2 digit year) date and time are valid"
+
+    return (
+        1 <= month <= 12
+        and 1 <= day <= _days_in_month(year, month)
+        and hour < 24 and minute < 60 and second < 60
+    )
+
+
+def _days_in_month(year, month):
+    "return number of days of month in year 2000 + year"
+
+    if month == 2:
+        return 29 if year % 4 == 0 else 28
+    return 30 if month in (4, 6, 9, 11) else 31
+
+
+def saved_batch_records(batch, invalid="raise"):
+    """Return list of saved data records from a decode_saved_batch result
+
+    The records are the same as those of process_saved_data. Registers with
+    invalid data are handled according to invalid:
+
+    Value  | Effect
+    -------|----------------------------------------------------------
+    raise  | raise ValueError
+    emit   | keep the register, date and time are returned as strings
+           | exactly as stored and mode is None if it is invalid
+    clamp  | keep the register with date and time clamped to valid values
+    drop   | skip the register
+    """
+
+    if invalid not in INVALID_MODES:
+        raise Exception("Unknown mode for invalid data `{}`".format(invalid))
+
+    dat = []
+    for i in range(batch["used"]):
+        year, weekday, month, day, hour, minute, second, pos, datH, datL, stat0, stat1 = (
+            batch[name][i] for name in SAVED_FIELDS[1:]
+        )
+        stat1 = STAT1_TABLE[stat1]
+
+        exact = False
+        if batch["valid"][i]:
+            stat0 = STAT0_TABLE[stat0]
+        elif invalid == "raise":
+            raise ValueError(
+                "Invalid data in saved register {}: 20{:02d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d} stat0=0x{:02x}".format(
+                    pos, year, month, day, hour, minute, second, stat0
+                )
+            )
+        elif invalid == "drop":
+            continue
+        else:
+            # keep unit and range if only the mode is broken
+            entry = STAT0_TABLE[stat0]
+            if entry is None:
+                entry = dict(STAT0_TABLE[stat0 & 0b11000111], mode=None)
+            stat0 = entry
+            if invalid == "emit":
+                exact = True
+            else:
+                month = min(max(month, 1), 12)
+                day = min(max(day, 1), _days_in_month(year, month))
+                hour, minute, second = min(hour, 23), min(minute, 59), min(second, 59)
+
+        dat.append(SavedRecord(
+            pos, (year, month, day, hour, minute, second), weekday, 100 * datH + datL, stat0, stat1, exact
+        ))
+
+    return dat
+
+
+# One entry of the logging group index of a logger data blob
+#   offset:  offset of the group header in the blob
+#   length:  size of the group (header and data records) in bytes
+#   points:  number of data records
+#   start:   datetime of the first data record
+LoggerGroup = namedtuple(
+    "LoggerGroup", ("groupno", "offset", "length", "points", "sampling", "start", "weekday")
+)
+
+
+def _logger_group_end(blob, start):
+    """return the offset where the data records of a logging group end
+
+    start is the offset of the first data record. The group ends at the next
+    group header or at the end of the blob. Only offsets aligned to the 3 byte
+    data records are considered as the magic number may straddle two records
+    (stat0 followed by valH).
+    """
+
+    pos = start
+    while True:
+        pos = blob.find(b"\xaa\x56", pos)
+        if pos < 0:
+            return start + (len(blob) - start) // POINT_LAYOUT.size * POINT_LAYOUT.size
+        if (pos - start) % POINT_LAYOUT.size == 0:
+            return pos
+        pos += 1
+
+
+def index_logger_groups(blob):
+    """Return a list of LoggerGroup tuples describing each group in a logger blob
+
+    Group boundaries are found with a byte scan for the group magic number
+    instead of parsing every data record (see protocol.md for why this is
+    safe). The index allows decoding selected groups only.
+    """
+
+    magic, nogroups, bufsize = LOGGER_LAYOUT.unpack_from(blob)
+    if magic != b"\xaa\xcc":
+        raise ValueError("Not a logger data blob")
+
+    index = []
+    offset = LOGGER_LAYOUT.size
+    for g in range(nogroups):
+        (magic, groupno, sampling, reserved, year, weekday, month, day,
+            hour, minute, second) = GROUP_LAYOUT.unpack_from(blob, offset)
+        if magic != b"\xaa\x56" or reserved != b"\x00\x00":
+            raise ValueError("Invalid logging group header at offset {}".format(offset))
+        end = _logger_group_end(blob, offset + GROUP_LAYOUT.size)
+
+        year, weekday, month, day, hour, minute, second = (
+            bcd_byte(x) for x in (year, weekday, month, day, hour, minute, second)
+        )
+        index.append(LoggerGroup(
+            groupno=groupno,
+            offset=offset,
+            length=end - offset,
+            points=(end - offset - GROUP_LAYOUT.size) // POINT_LAYOUT.size,
+            sampling=sampling,
+            start=datetime.datetime(2000 + year, month, day, hour, minute, second),
+            weekday=weekday,
+        ))
+        offset = end
+
+    return index
+
+
+def _select_groups(index, groups):
+    "return the entries of index whose groupno is in groups (all if groups is None)"
+
+    if groups is None:
+        return index
+    return [group for group in index if group.groupno in groups]
+
+
+def default_cache_path():
+    "return the default path of the logger group cache"
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pce174", "logger-groups.json")
+
+
+class LoggerCache:
+    """Remember which logging groups have been read before
+
+    For each group, the cache stores its number, sampling interval, start
+    time, first data record, number of data points and a hash of its data
+    records. A group is identified by sampling interval, start time and first
+    data record, so groups are recognized even if the instrument renumbered
+    them. `update` compares a logger blob
+    with the cache and returns where the new data starts:
+
+    - groups that are not in the cache are new
+    - groups that gained data points since they were cached (logging was
+      still running) are new from the first point not seen before
+    - groups whose data changed are new as a whole
+
+    Notes on renumbered groups and cleared logger memory are written to
+    STDERR. Call `save` once the new data has been processed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_cache_path()
+        self.groups = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for entry in json.load(f)["groups"]:
+                    self.groups[(entry["sampling"], entry["start"], entry["first"])] = entry
+
+    @staticmethod
+    def _hash(blob, group, points):
+        "return the hash of the first points data records of group"
+
+        start = group.offset + GROUP_LAYOUT.size
+        return hashlib.sha1(blob[start : start + points * POINT_LAYOUT.size]).hexdigest()
+
+    def update(self, blob, groups=None):
+        """compare logger blob with the cache and update the cache
+
+        groups optionally restricts the update to the given group numbers,
+        the cache entries of the other groups are kept as they are.
+
+        returns a dict {groupno: id of the first new data point} of the
+        groups with new data
+        """
+
+        new = {}
+        present = set()  # keys of all groups in the blob
+        updated = {}
+        index = index_logger_groups(blob)
+        for group in index:
+            start = group.offset + GROUP_LAYOUT.size
+            key = (group.sampling, group.start.isoformat(), blob[start : start + POINT_LAYOUT.size].hex())
+            present.add(key)
+            if groups is not None and group.groupno not in groups:
+                continue
+            entry = {
+                "groupno": group.groupno,
+                "sampling": group.sampling,
+                "start": group.start.isoformat(),
+                "first": key[2],
+                "points": group.points,
+                "hash": self._hash(blob, group, group.points),
             }
+            cached = self.groups.get(key)
+            updated[key] = entry
+            if cached is None:
+                new[group.groupno] = 0
+                continue
+            if cached["groupno"] != group.groupno:
+                sys.stderr.write("Logging group {} was renumbered to {}\n".format(cached["groupno"], group.groupno))
+            if entry["hash"] == cached["hash"]:
+                continue
+            if group.points > cached["points"] and self._hash(blob, group, cached["points"]) == cached["hash"]:
+                new[group.groupno] = cached["points"]
+            else:
+                new[group.groupno] = 0
+
+        if self.groups and index and not present & set(self.groups):
+            sys.stderr.write("Logger memory was cleared since the last read\n")
+        # groups that are no longer in the instrument are forgotten
+        self.groups = {
+            key: updated.get(key, self.groups.get(key)) for key in present if key in updated or key in self.groups
+        }
+        return new
+
+    def save(self):
+        "write the cache to its file"
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"groups": list(self.groups.values())}, f, indent=1)
+        os.replace(tmp, self.path)
 
-            logger.append(rec)
-            dtime += datetime.timedelta(seconds=group["sampling"])
 
+def new_logger_data(blob, cache, outformat, sep, header=True, groups=None, out=None):
+    """return the logger data of blob that is not in cache
+
+    Only groups with new data are decoded (see LoggerCache.update) and
+    records that were read before are dropped. The cache is updated for the
+    selected groups but not saved. outformat is `repr` or `csv`, the other arguments are the same as
+    for decode_blob. The groups are always decoded with the fast backend, as
+    only it decodes single groups.
+    """
+
+    if outformat not in ("repr", "csv"):
+        sys.exit("Only repr and csv output can be restricted to new logger data")
+    new = cache.update(blob, groups)
+    dat = []
+    for group in index_logger_groups(blob):
+        if group.groupno in new:
+            dat.extend(fast_logger_group(blob, group)[new[group.groupno]:])
+    if outformat == "csv":
+        return _csv_output(logger_csv_lines(dat, sep, header=header), out)
+    return dat
+
+
+def fast_logger_data(blob, groups=None):
+    """Return processed logger data from a logger data blob
+
+    Fast decoder backend: returns the same records as
+    process_logger_data(parse_logger_data(blob)) without using construct.
+
+    groups optionally restricts decoding to the given group numbers.
+    """
+
+    logger = []
+    for group in _select_groups(index_logger_groups(blob), groups):
+        logger.extend(fast_logger_group(blob, group))
     return logger
 
 
-def live_data2csv(dat, sep, header=True):
-    """returns csv from live data dict"""
-
-    # define columns and assemble header
-    cols = (
-        "date",
-        "weekday",
-        "time",
-        "value",
-        "rawvalue",
-        "unit",
-        "range",
-        "mode",
-        "hold",
-        "apo",
-        "power",
-        "view",
-        "memstat",
-        "mem_no",
-        "read_no",
-    )
-
-    csv = []
+def fast_logger_group(blob, group):
+    "Return processed logger data of a single group (a LoggerGroup entry)"
+
+    start = group.offset + GROUP_LAYOUT.size
+    points = memoryview(blob)[start : start + group.points * POINT_LAYOUT.size]
+    return [
+        LoggerRecord(group, i, 100 * datH + datL, _stat0(stat0))
+        for i, (datH, datL, stat0) in enumerate(POINT_LAYOUT.iter_unpack(points))
+    ]
+
+
+# Column layout of the structured array returned by numpy_logger_data
+LOGGER_DTYPE = [
+    ("groupno", "u1"),
+    ("id", "u4"),
+    ("timestamp", "datetime64[s]"),
+    ("weekday", "u1"),
+    ("sampling", "u1"),
+    ("counts", "u2"),   # 100 * valH + valL
+    ("exp", "i1"),      # decimal exponent: value = counts * 10**exp
+    ("unit", "u1"),     # stat0 bit 2
+    ("range", "u1"),    # stat0 bits 1,0 (range level)
+    ("mode", "u1"),     # stat0 bits 5,4,3
+    ("hold", "u1"),     # stat0 bit 6
+    ("apo", "u1"),      # stat0 bit 7
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy_stat0_columns():
+    "return 256 entry lookup arrays for the stat0 derived logger columns"
+
+    byte = np.arange(256, dtype=np.uint8)
+    return {
+        "valid": np.array([entry is not None for entry in STAT0_TABLE]),
+        "exp": np.array([entry["exp"] if entry else 0 for entry in STAT0_TABLE], dtype=np.int8),
+        "unit": byte >> 2 & 1,
+        "range": byte & 0b11,
+        "mode": byte >> 3 & 0b111,
+        "hold": byte >> 6 & 1,
+        "apo": byte >> 7,
+    }
+
+
+def numpy_logger_data(blob, groups=None):
+    """Return logger data as a NumPy structured array (see LOGGER_DTYPE)
+
+    Vectorized alternative to fast_logger_data that needs a few bytes per data
+    point instead of a dict. Time stamps are computed as group start + id *
+    sampling. The value of a data point is counts * 10**exp.
+
+    groups optionally restricts decoding to the given group numbers.
+
+    Requires numpy.
+    """
+
+    if np is None:
+        raise ImportError("numpy_logger_data requires numpy")
+
+    index = _select_groups(index_logger_groups(blob), groups)
+    if not index:
+        return np.empty(0, dtype=LOGGER_DTYPE)
+    return np.concatenate([numpy_logger_group(blob, group) for group in index])
+
+
+def numpy_logger_group(blob, group):
+    "Return logger data of a single group (a LoggerGroup entry) as a structured array"
+
+    n = group.points
+    points = np.frombuffer(
+        blob, dtype=np.uint8, count=n * POINT_LAYOUT.size, offset=group.offset + GROUP_LAYOUT.size
+    ).reshape(n, POINT_LAYOUT.size)
+    stat0 = points[:, 2]
+    columns = _numpy_stat0_columns()
+    if not columns["valid"][stat0].all():
+        raise ValueError("Invalid mode in stat0 byte of logging group {}".format(group.groupno))
+
+    dat = np.empty(n, dtype=LOGGER_DTYPE)
+    dat["groupno"] = group.groupno
+    dat["id"] = np.arange(n)
+    dat["timestamp"] = np.datetime64(group.start, "s") + dat["id"] * np.timedelta64(group.sampling, "s")
+    dat["weekday"] = group.weekday
+    dat["sampling"] = group.sampling
+    dat["counts"] = points[:, 0].astype(np.uint16) * 100 + points[:, 1]
+    for col in ("exp", "unit", "range", "mode", "hold", "apo"):
+        dat[col] = columns[col][stat0]
+
+    return dat
+
+
+def _decode_group_slice(args):
+    "decode one logging group from a blob slice (worker of decode_logger_parallel)"
+
+    blob, group, decoder = args
+    if decoder == "numpy":
+        return numpy_logger_group(blob, group)
+    return fast_logger_group(blob, group)
+
+
+def decode_logger_parallel(blob, groups=None, jobs=None, decoder="fast"):
+    """Decode the groups of a logger blob in parallel across a process pool
+
+    Each worker receives only the bytes of its own group. Results are returned
+    in group order: a list of dicts like fast_logger_data, or a structured
+    array like numpy_logger_data if decoder is `numpy`.
+
+    jobs is the number of worker processes (default: number of CPUs).
+    """
+
+    index = _select_groups(index_logger_groups(blob), groups)
+    tasks = [
+        (bytes(blob[g.offset : g.offset + g.length]), g._replace(offset=0), decoder)
+        for g in index
+    ]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        parts = list(pool.map(_decode_group_slice, tasks))
+
+    if decoder == "numpy":
+        if not parts:
+            return np.empty(0, dtype=LOGGER_DTYPE)
+        return np.concatenate(parts)
+    return [rec for part in parts for rec in part]
+
+
+def scale(counts, exp):
+    """return counts * 10**exp as float
+
+    Dividing by a power of 10 instead of multiplying with Frange gives the
+    float closest to the exact decimal, e.g. 14.6 instead of 14.600000000000001.
+    """
+
+    return float(counts * 10 ** exp) if exp >= 0 else counts / 10 ** -exp
+
+
+def format_fixed(counts, exp):
+    """return counts * 10**exp as exact decimal string
+
+    The number of decimals is the resolution of the range, e.g.
+    format_fixed(146, -1) == "14.6", format_fixed(5, -2) == "0.05" and
+    format_fixed(376, 0) == "376".
+    """
+
+    if exp >= 0:
+        return str(counts * 10 ** exp)
+    whole, frac = divmod(abs(counts), 10 ** -exp)
+    return "%s%d.%0*d" % ("-" if counts < 0 else "", whole, -exp, frac)
+
+
+def write_lines(lines, out, chunksize=1 << 16):
+    """write lines to the binary file out in chunks of about chunksize bytes
+
+    Each line is terminated with a newline.
+    """
+
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line) + 1
+        if size >= chunksize:
+            out.write(("\n".join(chunk) + "\n").encode("utf-8"))
+            chunk = []
+            size = 0
+    if chunk:
+        out.write(("\n".join(chunk) + "\n").encode("utf-8"))
+
+
+def _csv_output(lines, out):
+    "return lines joined to a string or write them to out if it is not None"
+
+    if out is None:
+        return "\n".join(lines)
+    write_lines(lines, out)
+
+
+def _record_csv_line(rec, columns, sep):
+    "return the csv line of a record or dict"
+
+    if isinstance(rec, Record):
+        return sep.join(rec.csv_fields(columns))
+    return sep.join([str(rec[col]) for col in columns])
+
+
+# csv columns of live data
+LIVE_COLUMNS = (
+    "date",
+    "weekday",
+    "time",
+    "value",
+    "rawvalue",
+    "unit",
+    "range",
+    "mode",
+    "hold",
+    "apo",
+    "power",
+    "view",
+    "memstat",
+    "mem_no",
+    "read_no",
+)
+
+
+def live_csv_lines(dat, sep, header=True):
+    "yield the csv lines (without line end) of a live data record"
+
     if header:
-        csv = [sep.join(cols)]
-    csv.append(sep.join(([str(dat[col]) for col in cols])))
+        yield sep.join(LIVE_COLUMNS)
+    yield _record_csv_line(dat, LIVE_COLUMNS, sep)
 
-    return "\n".join(csv)
 
+def live_data2csv(dat, sep, header=True):
+    """returns csv from a live data record"""
+
+    return "\n".join(live_csv_lines(dat, sep, header))
 
-def saved_data2csv(dat, sep, header=True):
-    "returns csv from live data dict"
 
-    cols = (
-        "pos",
-        "date",
-        "weekday",
-        "time",
-        "value",
-        "unit",
-        "range",
-        "mode",
-        "hold",
-        "apo",
-        "power",
-        "view",
-        "memstat",
-    )
-    csv = []
+# csv columns of saved data
+SAVED_COLUMNS = (
+    "pos",
+    "date",
+    "weekday",
+    "time",
+    "value",
+    "unit",
+    "range",
+    "mode",
+    "hold",
+    "apo",
+    "power",
+    "view",
+    "memstat",
+)
+
+
+def saved_csv_lines(dat, sep, header=True):
+    "yield the csv lines (without line end) of a list of saved data records"
+
     if header:
-        csv = [sep.join(cols)]
+        yield sep.join(SAVED_COLUMNS)
     for rec in dat:
         if rec["pos"] > 0:
-            csv.append(sep.join(([str(rec[col]) for col in cols])))
+            yield _record_csv_line(rec, SAVED_COLUMNS, sep)
 
-    return "\n".join(csv)
 
+def saved_data2csv(dat, sep, header=True):
+    "returns csv from live data dict"
+
+    return "\n".join(saved_csv_lines(dat, sep, header))
+
+
+# csv columns of logger data
+LOGGER_COLUMNS = (
+    "groupno",
+    "id",
+    "date",
+    "weekday",
+    "time",
+    "value",
+    "unit",
+    "range",
+    "mode",
+    "hold",
+    "apo",
+)
+# columns of logger data that are taken from the stat0 byte
+LOGGER_STAT0_COLUMNS = LOGGER_COLUMNS[6:]
+
+
+def logger_csv_lines(dat, sep, header=True):
+    """yield the csv lines (without line end) of logger data
+
+    dat is a list of logger records or a structured array from
+    numpy_logger_data. The fields that depend on the group and the stat0
+    byte are formatted once and reused.
+    """
 
-def logger_data2csv(dat, sep, header=True):
-    "returns csv from logger data list"
-
-    cols = (
-        "groupno",
-        "id",
-        "date",
-        "weekday",
-        "time",
-        "value",
-        "unit",
-        "range",
-        "mode",
-        "hold",
-        "apo",
-    )
-    csv = []
     if header:
-        csv = [sep.join(cols)]
+        yield sep.join(LOGGER_COLUMNS)
+    if np is not None and isinstance(dat, np.ndarray):
+        yield from _logger_array_lines(dat, sep)
+        return
+
+    group = None
+    tails = {}  # id of stat0 entry -> (entry, csv of the stat0 columns)
     for rec in dat:
-        csv.append(sep.join(([str(rec[col]) for col in cols])))
+        if not isinstance(rec, LoggerRecord):
+            yield _record_csv_line(rec, LOGGER_COLUMNS, sep)
+            continue
+        if rec._group is not group:
+            group = rec._group
+            start, step = group.start, datetime.timedelta(seconds=group.sampling)
+            groupno, weekday = str(group.groupno) + sep, sep + str(group.weekday) + sep
+        stat0 = rec._stat0
+        tail = tails.get(id(stat0))
+        if tail is None:
+            tail = tails[id(stat0)] = (stat0, sep + sep.join([str(stat0[col]) for col in LOGGER_STAT0_COLUMNS]))
+        stamp = (start + rec.id * step).isoformat()
+        yield (
+            groupno + str(rec.id) + sep + stamp[:10] + weekday + stamp[11:] + sep
+            + format_fixed(rec._counts, stat0["exp"]) + tail[1]
+        )
+
+
+def _logger_array_lines(arr, sep):
+    "yield csv lines from a numpy_logger_data array"
+
+    timestamps = np.datetime_as_string(arr["timestamp"], unit="s").tolist()
+    stat0 = (
+        arr["apo"].astype(np.uint8) << 7 | arr["hold"] << 6 | arr["mode"] << 3
+        | arr["unit"] << 2 | arr["range"]
+    ).tolist()
+    columns = zip(
+        arr["groupno"].tolist(), arr["id"].tolist(), timestamps,
+        arr["weekday"].tolist(), arr["counts"].tolist(), stat0,
+    )
+    tails = {}  # stat0 byte -> (exponent, csv of the stat0 columns)
+    for groupno, i, timestamp, weekday, counts, byte in columns:
+        tail = tails.get(byte)
+        if tail is None:
+            entry = STAT0_TABLE[byte]
+            tail = tails[byte] = (entry["exp"], sep + sep.join([str(entry[col]) for col in LOGGER_STAT0_COLUMNS]))
+        yield sep.join((
+            str(groupno), str(i), timestamp[:10], str(weekday), timestamp[11:], format_fixed(counts, tail[0])
+        )) + tail[1]
+
+
+def logger_data2csv(dat, sep, header=True):
+    """returns csv from logger data list
+
+    dat may also be a structured array from numpy_logger_data
+    """
+
+    return "\n".join(logger_csv_lines(dat, sep, header))
+
+
+# SQLite tables for the data types. Saved and logger rows are keyed by what
+# identifies a reading on the instrument, so reading the memory again updates
+# rows instead of duplicating them.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS live (
+    port TEXT, hosttime REAL, timestamp TEXT, weekday INTEGER,
+    counts INTEGER, rawcounts INTEGER, exponent INTEGER, value REAL, rawvalue REAL,
+    unit TEXT, range TEXT, mode TEXT, hold TEXT, apo TEXT, power TEXT, view TEXT, memstat TEXT,
+    mem_no INTEGER, read_no INTEGER,
+    PRIMARY KEY (port, hosttime)
+);
+CREATE INDEX IF NOT EXISTS live_timestamp ON live (timestamp);
+CREATE TABLE IF NOT EXISTS saved (
+    pos INTEGER, timestamp TEXT, weekday INTEGER,
+    counts INTEGER, exponent INTEGER, value REAL,
+    unit TEXT, range TEXT, mode TEXT, hold TEXT, apo TEXT, power TEXT, view TEXT, memstat TEXT,
+    PRIMARY KEY (timestamp, pos)
+);
+CREATE INDEX IF NOT EXISTS saved_timestamp ON saved (timestamp);
+CREATE TABLE IF NOT EXISTS logger (
+    start TEXT, id INTEGER, groupno INTEGER, sampling INTEGER, timestamp TEXT, weekday INTEGER,
+    counts INTEGER, exponent INTEGER, value REAL,
+    unit TEXT, range TEXT, mode TEXT, hold TEXT, apo TEXT,
+    PRIMARY KEY (start, id)
+);
+CREATE INDEX IF NOT EXISTS logger_timestamp ON logger (timestamp);
+"""
+# columns of the tables and their keys
+SQLITE_TABLES = {
+    "live": (
+        ("port", "hosttime", "timestamp", "weekday", "counts", "rawcounts", "exponent", "value", "rawvalue",
+         "unit", "range", "mode", "hold", "apo", "power", "view", "memstat", "mem_no", "read_no"),
+        ("port", "hosttime"),
+    ),
+    "saved": (
+        ("pos", "timestamp", "weekday", "counts", "exponent", "value",
+         "unit", "range", "mode", "hold", "apo", "power", "view", "memstat"),
+        ("timestamp", "pos"),
+    ),
+    "logger": (
+        ("start", "id", "groupno", "sampling", "timestamp", "weekday", "counts", "exponent", "value",
+         "unit", "range", "mode", "hold", "apo"),
+        ("start", "id"),
+    ),
+}
+
+
+class SQLiteWriter:
+    """Write records to an SQLite database
+
+    The database uses WAL mode, so it can be queried while logging. Records
+    are inserted with upserts (see SQLITE_SCHEMA for the keys) in batched
+    transactions: `write` commits its records at once, `add` buffers live
+    records and commits when `batch_size` rows are pending or `batch_time`
+    seconds have passed since the last commit.
+
+        with SQLiteWriter("light.db") as db:
+            db.write("logger", read_data(port, "logger"))
+    """
+
+    def __init__(self, path, batch_size=1000, batch_time=10.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SQLITE_SCHEMA)
+        self.pending = []
+        self.committed = time.monotonic()
+        self.statements = {}
+        for table, (columns, key) in SQLITE_TABLES.items():
+            self.statements[table] = "INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {}".format(
+                table, ", ".join(columns), ", ".join("?" * len(columns)), ", ".join(key),
+                ", ".join("{0}=excluded.{0}".format(col) for col in columns if col not in key),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def row(table, rec, port=None):
+        "return the table row for record rec"
+
+        if table == "live":
+            row = [
+                port, time.time(), "{} {}".format(rec["date"], rec["time"]), rec["weekday"],
+                rec.counts, rec.rawcounts, rec.exponent, rec["value"], rec["rawvalue"],
+            ]
+        elif table == "saved":
+            row = [
+                rec["pos"], "{} {}".format(rec["date"], rec["time"]), rec["weekday"],
+                rec.counts, rec.exponent, rec["value"],
+            ]
+        else:
+            row = [
+                rec._group.start.isoformat(" "), rec["id"], rec["groupno"], rec["sampling"],
+                rec.timestamp.isoformat(" "), rec["weekday"], rec.counts, rec.exponent, rec["value"],
+            ]
+        # the status columns are the same as in the record
+        columns = SQLITE_TABLES[table][0]
+        return row + [rec[col] for col in columns[len(row):]]
+
+    def write(self, table, records, port=None):
+        "write records to table in one transaction, returns the number of rows"
+
+        rows = [self.row(table, rec, port) for rec in records]
+        with self.db:
+            self.db.executemany(self.statements[table], rows)
+        return len(rows)
+
+    def add(self, rec, port=None):
+        "add a live data record, the batch is committed when it is full or old enough"
+
+        self.pending.append(self.row("live", rec, port))
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.committed >= self.batch_time:
+            self.flush()
+
+    def flush(self):
+        "commit the pending live data records"
+
+        if self.pending:
+            with self.db:
+                self.db.executemany(self.statements["live"], self.pending)
+            self.pending = []
+        self.committed = time.monotonic()
+
+    def close(self):
+        "commit pending records and close the database"
+
+        self.flush()
+        self.db.close()
+
+
+# Archive files start with this magic number and version
+ARCHIVE_MAGIC = b"PCE174A\x01"
+# archive record: host time stamp [s since epoch], live data blob
+ARCHIVE_RECORD = struct.Struct("<d18s")
+# index entry: host time stamp and number of an archive record
+ARCHIVE_INDEX = struct.Struct("<dQ")
+
+
+class FrameArchive:
+    """Append-only file of live data blobs with host time stamps
+
+    The file consists of ARCHIVE_MAGIC followed by fixed size records
+    (ARCHIVE_RECORD), so a record is 26 bytes instead of about 100 bytes of
+    csv. Every `interval`-th record is also written to a sparse index in the
+    sidecar file `path.idx` (ARCHIVE_INDEX entries), which `read` uses to
+    seek close to the start of a time range.
+
+        with FrameArchive("light.pca", "a") as archive:
+            archive.append(time.time(), blob)
+
+        with FrameArchive("light.pca") as archive:
+            for hosttime, blob in archive.read(start, end):
+                ...
+
+    mode is "r" (read) or "a" (append, creates the file). When opened for
+    appending, a partial record left by a crash is dropped and the index is
+    brought up to date.
+    """
+
+    def __init__(self, path, mode="r", interval=256):
+        if mode not in ("r", "a"):
+            raise ValueError("Unknown archive mode `{}`".format(mode))
+        self.path = path
+        self.interval = interval
+        self.file = open(path, "rb" if mode == "r" else "a+b")
+        self.index = None
+        try:
+            self.file.seek(0)
+            magic = self.file.read(len(ARCHIVE_MAGIC))
+            if mode == "a" and not magic:
+                self.file.write(ARCHIVE_MAGIC)
+                self.file.flush()
+            elif magic != ARCHIVE_MAGIC:
+                raise ValueError("{} is not a PCE-174 archive".format(path))
+            if mode == "a":
+                self._repair()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        "return the number of records"
+
+        self.file.seek(0, os.SEEK_END)
+        return (self.file.tell() - len(ARCHIVE_MAGIC)) // ARCHIVE_RECORD.size
+
+    def _record(self, recno):
+        "return record number recno as (hosttime, blob)"
+
+        self.file.seek(len(ARCHIVE_MAGIC) + recno * ARCHIVE_RECORD.size)
+        return ARCHIVE_RECORD.unpack(self.file.read(ARCHIVE_RECORD.size))
+
+    def _repair(self):
+        "drop a partial last record and add missing index entries"
+
+        self.records = len(self)
+        self.file.truncate(len(ARCHIVE_MAGIC) + self.records * ARCHIVE_RECORD.size)
+        self.index = open(self.path + ".idx", "a+b")
+        entries = -(-self.records // self.interval)
+        self.index.seek(0, os.SEEK_END)
+        indexed = min(self.index.tell() // ARCHIVE_INDEX.size, entries)
+        self.index.truncate(indexed * ARCHIVE_INDEX.size)
+        for entry in range(indexed, entries):
+            recno = entry * self.interval
+            self.index.write(ARCHIVE_INDEX.pack(self._record(recno)[0], recno))
+        self.index.flush()
+
+    def append(self, hosttime, blob):
+        "append a live data blob taken at hosttime (s since epoch)"
+
+        if self.index is None:
+            raise Exception("Archive {} is not open for appending".format(self.path))
+        if len(blob) != 18:
+            raise ValueError("Invalid live data blob of {} bytes".format(len(blob)))
+        self.file.write(ARCHIVE_RECORD.pack(hosttime, blob))
+        self.file.flush()
+        if self.records % self.interval == 0:
+            self.index.write(ARCHIVE_INDEX.pack(hosttime, self.records))
+            self.index.flush()
+        self.records += 1
+
+    def _first(self, start):
+        "return the number of an indexed record taken before start"
+
+        try:
+            with open(self.path + ".idx", "rb") as f:
+                index = f.read()
+        except FileNotFoundError:
+            return 0
+        entries = list(ARCHIVE_INDEX.iter_unpack(index[:len(index) // ARCHIVE_INDEX.size * ARCHIVE_INDEX.size]))
+        pos = bisect.bisect_left([hosttime for hosttime, recno in entries], start)
+        return entries[pos - 1][1] if pos else 0
+
+    def read(self, start=None, end=None):
+        """yield (hosttime, blob) of the records taken in [start, end)
+
+        start and end are host time stamps in s since epoch, None means no
+        limit. The file is memory-mapped and only the records from the last
+        index entry before start on are looked at.
+        """
+
+        self.file.flush()
+        n = len(self)
+        if n == 0:
+            return
+        first = 0 if start is None else self._first(start)
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for recno in range(first, n):
+                hosttime, blob = ARCHIVE_RECORD.unpack_from(data, len(ARCHIVE_MAGIC) + recno * ARCHIVE_RECORD.size)
+                if start is not None and hosttime < start:
+                    continue
+                if end is not None and hosttime >= end:
+                    break
+                yield hosttime, blob
+
+    def close(self):
+        "close the archive and its index"
+
+        self.file.close()
+        if self.index is not None:
+            self.index.close()
+
+
+def parse_time(text):
+    "return the time stamp [s since epoch] of a local date and time like `2019-03-10 17:22`, None for None"
+
+    if text is None:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        sys.exit("Invalid date and time `{}`".format(text))
+
+
+def extract_archive(path, outformat, sep=",", start=None, end=None, decoder=None, out=None):
+    """write the live data of an archive in the given outformat to out
+
+    Only records with host time stamps in [start, end) are extracted (see
+    FrameArchive.read). Each blob is decoded with decode_blob, so the output
+    is the same `log` writes in this format. out defaults to STDOUT.
+
+    returns the number of records written
+    """
+
+    out = out or sys.stdout.buffer
+    n = 0
+    with FrameArchive(path) as archive:
+        for hosttime, blob in archive.read(start, end):
+            if outformat == "raw":
+                out.write(blob)
+            else:
+                dat = decode_blob(blob, "live", outformat, sep, header=n == 0, decoder=decoder)
+                if outformat == "hex":
+                    out.write(dat + b"\n")
+                else:
+                    out.write((str(dat) + "\n").encode("utf-8"))
+            n += 1
+    return n
+
+
+# data types of the commands that request data
+DATA_COMMANDS = {0x11: "live", 0x12: "saved", 0x13: "logger"}
+
+
+def capture_responses(path):
+    """yield the responses recorded in a capture file (see WireCapture)
+
+    Yields (t, port, cmd, blob) for each command sent, where blob holds all
+    bytes received on the port until the next command was sent and t is the
+    time the last of them arrived (or the command was sent if there was no
+    response).
+    """
+
+    pending = {}  # port -> [t, cmd, received bytes]
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            try:
+                event = json.loads(line)
+                t, port, direction, data = event["t"], event["port"], event["dir"], bytes.fromhex(event["data"])
+            except (ValueError, KeyError) as e:
+                raise ValueError("Invalid capture record in line {}: {}".format(lineno, e))
+            if direction == "tx":
+                if port in pending:
+                    yield tuple([pending[port][0], port] + pending[port][1:])
+                cmd = data[2] if len(data) == 3 and data[:2] == b"\x87\x83" else None
+                pending[port] = [t, cmd, b""]
+            elif port in pending:
+                pending[port][0] = t
+                pending[port][2] += data
+    for port, (t, cmd, blob) in pending.items():
+        yield t, port, cmd, blob
+
+
+def replay(path, outformat, sep=",", speed=1.0, decoder=None, invalid="raise", timer=None, out=None):
+    """decode the data responses of a capture file (see WireCapture)
+
+    The responses to `read` commands are decoded and written to out (default:
+    STDOUT) in outformat as `read` and `log` would have done. Responses are
+    output at the pace they were received, `speed` times faster or, if speed
+    <= 0, as fast as possible. Responses that cannot be decoded are reported
+    on STDERR and skipped. timer optionally is a PhaseTimer that records the
+    decode and output phases of each response.
+
+    returns the number of responses decoded
+    """
+
+    out = out or sys.stdout.buffer
+    phase = timer.phase if timer is not None else lambda name: contextlib.nullcontext()
+    n = 0
+    live = 0  # number of live records, the csv header is written once
+    start = first = None
+    for t, port, cmd, blob in capture_responses(path):
+        datatype = DATA_COMMANDS.get(cmd)
+        if datatype is None:
+            continue
+        if first is None:
+            start, first = time.monotonic(), t
+        elif speed > 0:
+            time.sleep(max(0, (t - first) / speed - (time.monotonic() - start)))
+        if timer is not None:
+            timer.begin("0x{:02x}".format(cmd))
+        with phase("decode"):
+            try:
+                dat = decode_blob(
+                    blob, datatype, outformat, sep, header=datatype != "live" or live == 0,
+                    decoder=decoder, invalid=invalid,
+                )
+            except Exception as e:
+                # e.g. the instrument did not answer, go on with the next response
+                sys.stderr.write("{} at {}: cannot decode {} data: {}\n".format(port, t, datatype, e))
+                continue
+        with phase("output"):
+            if outformat in ("repr", "csv", "construct"):
+                dat = (str(dat) + "\n").encode("utf-8")
+            elif outformat == "hex":
+                # one response per line as `log` does
+                dat = dat + b"\n"
+            out.write(bytes(dat))
+            out.flush()
+        live += datatype == "live"
+        n += 1
+    return n
+
+
+# data types of raw dumps by magic number
+MAGIC_TYPES = {b"\xaa\xdd": "live", b"\xbb\x88": "saved", b"\xaa\xcc": "logger"}
+
+
+def convert_inputs(paths):
+    """return the files to convert for a list of paths
+
+    Each path may be a file, a directory (all files in it) or a glob pattern.
+    Directories and patterns are expanded in sorted order.
+    """
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))
+            ))
+        elif glob.has_magic(path):
+            files.extend(sorted(name for name in glob.glob(path) if os.path.isfile(name)))
+        else:
+            files.append(path)
+    return files
+
+
+def convert_tasks(path, outformat, sep=",", decoder=None, invalid="raise", frames=20000):
+    """return the decoding tasks of a raw dump (see _convert_task)
+
+    The type of the dump is detected from its magic number. Files of
+    concatenated live data blobs are split into tasks of `frames` blobs,
+    logger dumps into one task per logging group and saved data dumps are a
+    single task. The file is memory-mapped, so it is not read for this.
+    """
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 2:
+            raise ValueError("File too short")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            datatype = MAGIC_TYPES.get(data[:2])
+            if datatype is None:
+                raise ValueError("Unknown magic number 0x{}".format(data[:2].hex()))
+            if datatype == "live":
+                if size % LIVE_LAYOUT.size:
+                    raise ValueError("Size is not a multiple of {} bytes".format(LIVE_LAYOUT.size))
+                step = frames * LIVE_LAYOUT.size
+                ranges = [(start, min(start + step, size)) for start in range(0, size, step)]
+            elif datatype == "saved":
+                ranges = [(0, size)]
+            else:
+                ranges = [(g.offset, g.offset + g.length) for g in index_logger_groups(data)]
+    return [
+        (path, datatype, start, end, outformat, sep, i == 0, decoder, invalid)
+        for i, (start, end) in enumerate(ranges)
+    ]
+
+
+def _convert_task(task):
+    """decode a part of a raw dump and return the output as bytes
+
+    task is (path, datatype, start, end, outformat, sep, header, decoder,
+    invalid) as returned by convert_tasks. The worker maps the file itself,
+    so only the position of the part is sent to it.
+    """
+
+    path, datatype, start, end, outformat, sep, header, decoder, invalid = task
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if datatype == "live":
+            blobs = [data[pos : pos + LIVE_LAYOUT.size] for pos in range(start, end, LIVE_LAYOUT.size)]
+        elif datatype == "saved":
+            blobs = [data[start:end]]
+        else:
+            # a logger blob of its own for the group
+            blobs = [LOGGER_LAYOUT.pack(b"\xaa\xcc", 1, end - start) + data[start:end]]
+    lines = []
+    for blob in blobs:
+        dat = decode_blob(blob, datatype, "repr", sep, decoder=decoder, invalid=invalid)
+        records = [dat] if datatype == "live" else dat
+        if outformat == "repr":
+            lines.extend(str(rec) for rec in records)
+        elif datatype == "live":
+            lines.extend(live_csv_lines(dat, sep, header=header))
+        elif datatype == "saved":
+            lines.extend(saved_csv_lines(records, sep))
+        else:
+            lines.extend(logger_csv_lines(records, sep, header=header))
+        header = False
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def convert(paths, outformat, sep=",", decoder=None, invalid="raise", jobs=1, out=None):
+    """decode raw dumps and write them in outformat to out (default: STDOUT)
+
+    paths are files, directories or glob patterns (see convert_inputs) of
+    raw dumps of any data type, e.g. written with `read -f raw` or `log -f
+    raw`. The output of each file is the same as `read -F` gives in the csv
+    format, in the repr format one record per line. Files are written in
+    input order.
+
+    With jobs > 1 the parts of the files (see convert_tasks) are decoded in
+    a process pool. At most 2 * jobs parts are in flight, so memory does not
+    grow with the size of the files.
+
+    Files or parts that cannot be decoded are reported on STDERR and the rest
+    of the file is skipped. returns the number of failures.
+    """
+
+    if outformat not in ("csv", "repr"):
+        raise ValueError("convert supports the csv and repr formats")
+    out = out or sys.stdout.buffer
+    failed = 0
+
+    def tasks():
+        nonlocal failed
+        for path in convert_inputs(paths):
+            try:
+                parts = convert_tasks(path, outformat, sep, decoder, invalid)
+            except (OSError, ValueError) as e:
+                sys.stderr.write("{}: {}\n".format(path, e))
+                failed += 1
+                continue
+            yield from parts
+
+    def write(task, result):
+        nonlocal failed, skip
+        if task[0] == skip:
+            return
+        try:
+            dat = result()
+        except Exception as e:
+            sys.stderr.write("{}: {}\n".format(task[0], e))
+            failed += 1
+            skip = task[0]  # do not write the rest of a broken file
+            return
+        out.write(dat)
+
+    skip = None
+    if jobs <= 1:
+        for task in tasks():
+            write(task, functools.partial(_convert_task, task))
+        return failed
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for task in tasks():
+            pending.append((task, pool.submit(_convert_task, task)))
+            if len(pending) >= 2 * jobs:
+                task, future = pending.popleft()
+                write(task, future.result)
+        while pending:
+            task, future = pending.popleft()
+            write(task, future.result)
+    return failed
+
+
+# Order in which RIGHT (long press of REL) cycles through the views
+VIEWS = ("time", "day", "year", "sampling")
+
+# inverse lookup tables for encoding status bytes
+STAT0_CODES = {
+    (entry["apo"], entry["hold"], entry["mode"], entry["unit"], entry["range"]): byte
+    for byte, entry in enumerate(STAT0_TABLE) if entry is not None
+}
+STAT1_CODES = {
+    (entry["power"], entry["sign"], entry["view"], entry["memstat"]): byte
+    for byte, entry in enumerate(STAT1_TABLE[:0b1000000]) # bits 7,6 are reserved
+}
+
+
+def int2bcd(n):
+    "Return n (0-99) as a BCD encoded byte"
+
+    return (n // 10) << 4 | n % 10
+
+
+def encode_stat0(stat):
+    """return the stat0 byte for a dict with the keys unit, range, mode, hold and apo
+
+    Inverse of decode_stat0.
+    """
+
+    return STAT0_CODES[(stat["apo"], stat["hold"], stat["mode"], stat["unit"], stat["range"])]
+
+
+def encode_stat1(stat):
+    """return the stat1 byte for a dict with the keys power, sign, view and memstat
+
+    Inverse of decode_stat1.
+    """
+
+    return STAT1_CODES[(stat["power"], stat["sign"], stat["view"], stat["memstat"])]
+
+
+def _encode_datetime(dtime):
+    "return the 7 BCD bytes year, weekday, month, day, hour, minute, second"
+
+    return bytes(int2bcd(x) for x in (
+        dtime.year % 100, dtime.isoweekday(), dtime.month, dtime.day,
+        dtime.hour, dtime.minute, dtime.second,
+    ))
+
+
+def encode_live_data(dtime, counts, rawcounts, stat0, stat1, mem_no=0, read_no=1):
+    """Return a live data blob
+
+    counts and rawcounts are the unsigned values as 100 * valH + valL
+    (0-9999), stat0 and stat1 the status bytes. Inverse of parse_live_data.
+    """
+
+    return (
+        b"\xaa\xdd\x00" + _encode_datetime(dtime)
+        + bytes((rawcounts // 100, rawcounts % 100, counts // 100, counts % 100, stat0, stat1, mem_no, read_no))
+    )
+
+
+def encode_saved_data(records, trailing=0):
+    """Return a saved data blob
+
+    records is a list of up to 99 (dtime, counts, stat0, stat1) tuples that
+    are stored in positions 1, 2, ... The unused registers are empty.
+    trailing adds the given number of 0x00 bytes like the instrument does.
+    Inverse of parse_saved_data.
+    """
+
+    blob = b"\xbb\x88"
+    for pos, (dtime, counts, stat0, stat1) in enumerate(records[:99], 1):
+        blob += b"\x00" + _encode_datetime(dtime) + bytes((pos, counts // 100, counts % 100, stat0, stat1))
+    blob += bytes(SAVED_LAYOUT.size * (99 - min(len(records), 99)) + trailing)
+    return blob
+
+
+def encode_logger_data(groups):
+    """Return a logger data blob
+
+    groups is a list of (groupno, sampling, start, points) tuples where points
+    is a list of (counts, stat0) tuples. Inverse of parse_logger_data.
+    """
+
+    body = bytearray()
+    for groupno, sampling, start, points in groups:
+        body += bytes((0xaa, 0x56, groupno, sampling, 0, 0)) + _encode_datetime(start)
+        for counts, stat0 in points:
+            body += bytes((counts // 100, counts % 100, stat0))
+    return LOGGER_LAYOUT.pack(b"\xaa\xcc", len(groups), len(body)) + bytes(body)
+
+
+def press_effect(stat, cmd):
+    """Return the status after pressing the button with command code cmd
+
+    stat is a dict with (at least) the keys unit, range, mode, hold, view and
+    memstat as in live data records. This is a model of the instrument's
+    behaviour and used by the Simulator:
+
+    Button | Effect
+    -------|-------------------------------------------------------------
+    units  | toggle lux/fc, the range level is kept
+    range  | next range level (400 -> 4k -> 40k -> 400k -> 400 for lux)
+    max    | normal -> max -> min -> normal, other modes -> max
+    peak   | normal -> Pmax -> Pmin -> normal, other modes -> Pmax
+    rel    | rel -> normal, other modes -> rel
+    hold   | toggle cont/hold
+    RIGHT  | next view (time -> day -> year -> sampling -> time)
+    REC    | start/stop logging
+
+    Only the mode changes that `set` has always relied on are known to work
+    on the instrument: max and peak pressed once or twice starting in normal
+    mode and rel pressed until the mode is normal (see press_known). The
+    other mode changes are guesses for the Simulator.
+    """
+
+    stat = dict(stat)
+    if cmd == BUTTONS["units"]:
+        level = RANGES[stat["unit"]].index(stat["range"])
+        stat["unit"] = "fc" if stat["unit"] == "lux" else "lux"
+        stat["range"] = RANGES[stat["unit"]][level]
+    elif cmd == BUTTONS["range"]:
+        ranges = RANGES[stat["unit"]]
+        stat["range"] = ranges[(ranges.index(stat["range"]) + 1) % 4]
+    elif cmd == BUTTONS["max"]:
+        stat["mode"] = {"max": "min", "min": "normal"}.get(stat["mode"], "max")
+    elif cmd == BUTTONS["peak"]:
+        stat["mode"] = {"Pmax": "Pmin", "Pmin": "normal"}.get(stat["mode"], "Pmax")
+    elif cmd == BUTTONS["rel"]:
+        stat["mode"] = {"rel": "normal"}.get(stat["mode"], "rel")
+    elif cmd == BUTTONS["hold"]:
+        stat["hold"] = {"cont": "hold"}.get(stat["hold"], "cont")
+    elif cmd == BUTTONS["RIGHT"]:
+        stat["view"] = VIEWS[(VIEWS.index(stat["view"]) + 1) % 4]
+    elif cmd == BUTTONS["REC"]:
+        stat["memstat"] = None if stat["memstat"] == "logging" else "logging"
+    return stat
+
+
+# values accepted by `set`, Pmin and Pmax may also be given as pmin and pmax
+SETTINGS = {
+    "unit": ("lux", "fc"),
+    "range": RANGES,
+    "mode": ("normal", "rel", "min", "max", "Pmin", "Pmax"),
+    "hold": ("cont", "hold"),
+    "apo": ("on", "off"),
+    "view": VIEWS,
+}
+# buttons that change settings and the order in which they are pressed.
+# Presses of buttons with different order commute.
+SETTING_BUTTONS = {"units": 0, "range": 0, "max": 1, "peak": 1, "rel": 1, "hold": 2, "RIGHT": 3}
+# presses that enter each mode from normal mode
+MODE_PRESSES = {
+    "normal": [], "rel": [("rel", 1)], "max": [("max", 1)], "min": [("max", 2)],
+    "Pmax": [("peak", 1)], "Pmin": [("peak", 2)],
+}
+# modes in which the effect of max and peak is known (see press_effect)
+KNOWN_MODES = {"max": ("normal", "max"), "peak": ("normal", "Pmax")}
+
+
+def press_known(stat, button):
+    "return True if the effect of pressing button in status stat is known to match press_effect"
+
+    return button in SETTING_BUTTONS and stat["mode"] in KNOWN_MODES.get(button, SETTINGS["mode"])
+
+
+def check_settings(settings, stat):
+    """return settings with normalized values
+
+    Exits with an error message if a variable or value is invalid. Valid
+    ranges depend on the unit in settings or, if unit is not set, in the
+    status stat.
+    """
+
+    checked = {}
+    for var, value in sorted(settings.items(), key=lambda item: item[0] == "range"):
+        if var not in SETTINGS:
+            sys.exit("{} is not a valid argument to `set`".format(var))
+        if var == "mode":
+            value = {"pmin": "Pmin", "pmax": "Pmax"}.get(value, value)
+        if var == "range":
+            unit = checked.get("unit", stat["unit"])
+            if value not in RANGES[unit]:
+                sys.exit("`{}` is not a valid range for unit `{}`".format(value, unit))
+        elif value not in SETTINGS[var]:
+            sys.exit("`{}` is not a valid value for `{}`".format(value, var))
+        checked[var] = value
+    return checked
+
+
+def plan_presses(stat, settings):
+    """return the list of (button, n) presses that change status stat to settings
+
+    Only presses known to work on the instrument are used (see
+    press_effect): the range level is kept when the unit changes, a new
+    mode is entered from normal mode after pressing rel until the mode is
+    normal, and views are only changed with RIGHT. Presses are ordered as in
+    SETTING_BUTTONS. Returns None if settings cannot be reached by button
+    presses (e.g. apo).
+    """
+
+    if settings.get("apo", stat["apo"]) != stat["apo"]:
+        return None
+
+    plan = []
+    unit = settings.get("unit", stat["unit"])
+    if unit != stat["unit"]:
+        plan.append(("units", 1))
+    ranges = RANGES[unit]
+    current = ranges[RANGES[stat["unit"]].index(stat["range"])]
+    n = pressdist(current, settings.get("range", current), ranges)
+    if n:
+        plan.append(("range", n))
+    mode = settings.get("mode", stat["mode"])
+    if mode != stat["mode"]:
+        n = 0
+        state = stat
+        while state["mode"] != "normal":
+            state = press_effect(state, BUTTONS["rel"])
+            n += 1
+        if n:
+            plan.append(("rel", n))
+        plan += MODE_PRESSES[mode]
+    if settings.get("hold", stat["hold"]) != stat["hold"]:
+        plan.append(("hold", 1))
+    n = pressdist(stat["view"], settings.get("view", stat["view"]), VIEWS)
+    if n:
+        plan.append(("RIGHT", n))
+
+    # merge presses of the same button (rel to leave the mode, rel to enter it)
+    merged = []
+    for button, n in plan:
+        if merged and merged[-1][0] == button:
+            merged[-1][1] += n
+        else:
+            merged.append([button, n])
+    return [tuple(press) for press in merged]
+
+
+class Simulator:
+    """Virtual PCE-174 on a pseudo-terminal
+
+    Opens a pty that behaves like the instrument: it accepts the `0x87 0x83
+    <cmd>` protocol, answers 0x11/0x12/0x13 with correctly encoded blobs and
+    models the effect of button presses on the status (see press_effect).
+    Use the `port` attribute like a serial port:
+
+        with Simulator(latency=0.05, baudrate=9600) as sim:
+            dat = read_data(sim.port, "live")
+
+    latency  : delay before each response [s]
+    baudrate : if given, responses are paced like a serial line at this rate
+    corrupt  : probability that a response has one random byte corrupted
+    seed     : seed for the random number generator
+    value    : the (raw) reading in counts (0-9999)
+    saved    : saved data records (see encode_saved_data), default: 3 records
+    logger   : logger groups (see encode_logger_data), default: 2 groups
+    settle   : delay before a button press takes effect [s]
+
+    Unix only.
+    """
+
+    def __init__(self, latency=0.0, baudrate=None, corrupt=0.0, seed=None, value=146, saved=None, logger=None, settle=0.0):
+        self.latency = latency
+        self.settle = settle
+        self.pending = []  # (due time, command code) of presses that have not taken effect yet
+        self.baudrate = baudrate
+        self.corrupt = corrupt
+        self.random = random.Random(seed)
+        self.value = value
+        self.stat = {
+            "unit": "lux", "range": "400", "mode": "normal", "hold": "cont", "apo": "off",
+            "power": "ok", "view": "time", "memstat": None,
+        }
+        self.relref = 0
+        self.held = None
+        self.read_no = 1
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        stat0 = encode_stat0(self.stat)
+        stat1 = encode_stat1(dict(self.stat, sign=1, memstat="store"))
+        if saved is None:
+            saved = [(now - datetime.timedelta(minutes=10 - i), 100 + i, stat0, stat1) for i in range(3)]
+        if logger is None:
+            logger = [
+                (g, 2, now - datetime.timedelta(hours=2 - g), [(100 * g + i, stat0) for i in range(10)])
+                for g in (1, 2)
+            ]
+        self.saved = saved
+        self.logger = logger
+
+        self.received = 0  # number of commands received
+        self.port = None
+        self._fds = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        "open the pty and start answering commands"
+
+        import tty  # Unix only, needs termios
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self._fds = (master, slave)
+        self.port = os.ttyname(slave)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        "stop answering commands and close the pty"
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            for fd in self._fds:
+                os.close(fd)
+
+    def live_data(self):
+        "return a live data blob of the current state"
+
+        raw = self.value
+        value = raw - self.relref if self.stat["mode"] == "rel" else raw
+        if self.stat["hold"] == "hold":
+            if self.held is None:
+                self.held = value
+            value = self.held
+        else:
+            self.held = None
+        stat1 = encode_stat1(dict(self.stat, sign=-1 if value < 0 else 1))
+        return encode_live_data(
+            datetime.datetime.now(), abs(value), raw, encode_stat0(self.stat), stat1,
+            mem_no=len(self.saved), read_no=self.read_no,
+        )
+
+    def respond(self, cmd):
+        "return the response to command code cmd and update the state"
+
+        while self.pending and self.pending[0][0] <= time.monotonic():
+            self.press(self.pending.pop(0)[1])
+
+        if cmd == 0x11:
+            return self.live_data()
+        elif cmd == 0x12:
+            return encode_saved_data(self.saved, trailing=20)
+        elif cmd == 0x13:
+            return encode_logger_data(self.logger)
+
+        if self.settle:
+            self.pending.append((time.monotonic() + self.settle, cmd))
+        else:
+            self.press(cmd)
+        return b""
+
+    def press(self, cmd):
+        "apply the effect of the button with command code cmd"
+
+        stat = press_effect(self.stat, cmd)
+        if stat["mode"] == "rel" and self.stat["mode"] != "rel":
+            self.relref = self.value
+        if cmd == BUTTONS["rec"] and len(self.saved) < 99:
+            self.saved.append((
+                datetime.datetime.now().replace(microsecond=0), self.value,
+                encode_stat0(stat), encode_stat1(dict(stat, sign=1, memstat="store")),
+            ))
+        self.stat = stat
+
+    def _send(self, blob):
+        "write blob to the pty, applying latency, pacing and corruption"
+
+        if not blob:
+            return
+        if self.corrupt and self.random.random() < self.corrupt:
+            blob = bytearray(blob)
+            blob[self.random.randrange(len(blob))] ^= 1 << self.random.randrange(8)
+            blob = bytes(blob)
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.baudrate:
+            os.write(self._fds[0], blob)
+            return
+        # 10 bits per byte on the wire (8N1)
+        start = time.monotonic()
+        for i in range(0, len(blob), 16):
+            os.write(self._fds[0], blob[i : i + 16])
+            delay = start + 10 * (i + 16) / self.baudrate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _run(self):
+        "answer commands until stopped"
+
+        master = self._fds[0]
+        buf = b""
+        while not self._stop.is_set():
+            ready, _, _ = select.select([master], [], [], 0.05)
+            if not ready:
+                continue
+            buf += os.read(master, 1024)
+            while True:
+                i = buf.find(b"\x87\x83")
+                if i < 0 or len(buf) < i + 3:
+                    buf = buf[max(i, len(buf) - 1):] if i >= 0 else buf[-1:]
+                    break
+                cmd = buf[i + 2]
+                buf = buf[i + 3:]
+                self.received += 1
+                self._send(self.respond(cmd))
+
+
+def simulate(latency=0.0, baudrate=None, corrupt=0.0, settle=0.0):
+    "run a Simulator until interrupted, printing its port"
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with Simulator(latency=latency, baudrate=baudrate, corrupt=corrupt, settle=settle) as sim:
+        print(sim.port, flush=True)
+        while True:
+            time.sleep(1)
 
-    return "\n".join(csv)
+
+def _bench_blobs():
+    "return synthetic live, saved and full buffer logger blobs for bench"
+
+    dtime = datetime.datetime(2019, 3, 11, 21, 43, 50)
+    stat = {
+        "unit": "lux", "range": "400", "mode": "normal", "hold": "cont", "apo": "off",
+        "power": "ok", "sign": 1, "view": "time", "memstat": "store",
+    }
+    stat0, stat1 = encode_stat0(stat), encode_stat1(stat)
+    saved = [(dtime + datetime.timedelta(minutes=i), 37 * i % 10000, stat0, stat1) for i in range(99)]
+    # 16000 readings fill the logger memory
+    logger = [
+        (g, 1, dtime + datetime.timedelta(hours=g), [(g * i % 10000, stat0) for i in range(4000)])
+        for g in range(1, 5)
+    ]
+    return {
+        "live": encode_live_data(dtime, 376, 376, stat0, stat1, mem_no=99, read_no=1),
+        "saved": encode_saved_data(saved, trailing=20),
+        "logger": encode_logger_data(logger),
+    }
+
+
+def _bench_case(func, repeat, **info):
+    "call func repeat times and return a dict of timing statistics [s]"
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    info.update(
+        n=repeat, min=times[0], median=times[len(times) // 2],
+        mean=sum(times) / repeat, max=times[-1],
+    )
+    return info
+
+
+def bench(repeat=20, rounds=5, parts=("decode", "roundtrip")):
+    """Run benchmarks and return the results as a dict
+
+    decode    : decode_blob on synthetic live, saved and full buffer logger
+                blobs for all output formats and decoders (repeat times each)
+    roundtrip : `get status`, `set range` and one `log` sample against a
+                Simulator (rounds times each)
+
+    Times are in seconds. Decoding cases also report the throughput of the
+    median run in bytes/s.
+    """
+
+    results = OrderedDict(
+        python=sys.version.split()[0],
+        construct=version_string,
+        numpy=np.__version__ if np is not None else None,
+        time=datetime.datetime.now().isoformat(timespec="seconds"),
+        decode=[],
+        roundtrip=[],
+    )
+
+    if "decode" in parts:
+        decoders = [d for d in DECODERS if d != "numpy" or np is not None]
+        for datatype, blob in _bench_blobs().items():
+            for outformat in ("repr", "csv", "construct", "hex"):
+                # the decoder only matters for repr and csv
+                for decoder in decoders if outformat in ("repr", "csv") else [DEFAULT_DECODER]:
+                    case = _bench_case(
+                        functools.partial(decode_blob, blob, datatype, outformat, ",", decoder=decoder),
+                        repeat, datatype=datatype, format=outformat, decoder=decoder, bytes=len(blob),
+                    )
+                    case["throughput"] = len(blob) / case["median"]
+                    results["decode"].append(case)
+
+    if "roundtrip" in parts:
+        with Simulator() as sim, PCE174(sim.port) as meter:
+            ranges = iter(RANGES["lux"] * rounds)
+            results["roundtrip"] = [
+                _bench_case(lambda: meter.getvar("status"), rounds, command="get status"),
+                _bench_case(lambda: meter.setvar("range", next(ranges)), rounds, command="set range"),
+                _bench_case(
+                    lambda: meter.read_data("live", outformat="csv", header=False), rounds, command="log sample"
+                ),
+            ]
+
+    return results
 
 
 def getargs():
@@ -875,6 +4060,7 @@ Setting modes:
     set unit {lux|fc}
     set apo {on|off}
     set view {time|day|year|sampling}
+    set var=value [var=value ...]
 
 Valid `range` values depend on the current value of `unit` and will change
 magically, when the unit is changed. I.e. always set `unit` before `range`.
@@ -887,37 +4073,65 @@ Reading data from the instrument:
 
     read {live|saved|logger}
 
+Running commands from FILE (or STDIN) over one connection:
+
+    batch [FILE]
+
 
 Live logging - i.e. repeatedly reading live data:
 
     log
 
+Converting the live data of an archive written by `log -a`:
+
+    extract ARCHIVE [FROM [TO]]
+
+Decoding the data recorded with --capture again:
+
+    replay CAPTURE
+
+Decoding raw dumps in bulk:
+
+    convert {FILE|DIRECTORY|PATTERN} [...]
+
+Serving live data to local clients:
+
+    serve
+
+Running a virtual instrument on a pseudo-terminal:
+
+    simulate
+
+Benchmarking decoding and command round trips:
+
+    bench [decode|roundtrip]
+
 See README.md for details
 """
     )
 
     parser.add_argument(
         "-p",
-        dest="port",
+        dest="ports",
         type=str,
-        default="/dev/ttyUSB0",
-        help="port to connect to (default:/dev/ttyUSB0)",
+        action="append",
+        help="port to connect to (default:/dev/ttyUSB0). Repeat to `log` from several instruments",
     )
     parser.add_argument(
         "-f",
         dest="format",
         type=str,
         default="csv",
-        choices=["csv", "repr", "construct", "raw", "hex"],
-        help="specify output format for read commands (default:csv)",
+        choices=["csv", "repr", "construct", "raw", "hex", "sqlite"],
+        help="specify output format for read commands, sqlite writes to the --db database (default:csv)",
     )
     parser.add_argument(
         '-i',
         '--samplingint',
         dest="samplingint",
-        type=int,
+        type=float,
         default=1,
-        help="set sampling interval for tethered logging [s] (default:1)."
+        help="set sampling interval for tethered logging [s]; 0 means as fast as possible (default:1)."
         )
     parser.add_argument(
         '-n',
@@ -935,17 +4149,183 @@ See README.md for details
         default="",
         help="parse previously saved raw data instead of reading from the instrument",
     )
+    parser.add_argument(
+        "-d",
+        "--decoder",
+        dest="decoder",
+        type=str,
+        default=DEFAULT_DECODER,
+        choices=DECODERS,
+        help="decoder backend for repr and csv output (default:{})".format(DEFAULT_DECODER),
+    )
+    parser.add_argument(
+        "--invalid",
+        dest="invalid",
+        type=str,
+        default="raise",
+        choices=INVALID_MODES,
+        help="how to handle saved data registers with invalid data (default:raise)",
+    )
+    parser.add_argument(
+        "-g",
+        "--group",
+        dest="groups",
+        type=int,
+        action="append",
+        help="only decode this logging group of `read logger` (may be repeated)",
+    )
+    parser.add_argument(
+        "--new-only",
+        dest="new_only",
+        action="store_true",
+        help="`read logger` only outputs data that was not read before (see --cache)",
+    )
+    parser.add_argument(
+        "--no-header",
+        dest="no_header",
+        action="store_true",
+        help="`read` writes csv without the header line, e.g. to append it to a file",
+    )
+    parser.add_argument(
+        "--cache",
+        dest="cache",
+        type=str,
+        default=None,
+        help="cache of logging groups read before for --new-only (default: ~/.cache/pce174/logger-groups.json)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="number of processes for decoding logger groups and for `convert` (default:1)",
+    )
+    parser.add_argument(
+        "-S",
+        "--socket",
+        dest="socket",
+        type=str,
+        default=None,
+        help="socket of the `serve` daemon (default: pce174-PORT.sock in the temp directory)",
+    )
+    parser.add_argument(
+        "--db",
+        dest="db",
+        type=str,
+        default=None,
+        help="SQLite database for `read` and `log` (implies -f sqlite)",
+    )
+    parser.add_argument(
+        "-a",
+        "--archive",
+        dest="archive",
+        type=str,
+        default=None,
+        help="`log` appends the live data to this archive file instead of writing it to STDOUT",
+    )
+    parser.add_argument(
+        "--capture",
+        dest="capture",
+        type=str,
+        default=None,
+        help="record all bytes sent to and received from the instrument with time stamps to this file",
+    )
+    parser.add_argument(
+        "--speed",
+        dest="speed",
+        type=float,
+        default=1.0,
+        help="`replay` at this multiple of the original pace, 0 means as fast as possible (default:1)",
+    )
+    parser.add_argument(
+        "-w", "--window",
+        dest="window",
+        type=float,
+        default=None,
+        help="`log` writes min/max/mean/stddev/count of each window of this many seconds instead of the samples",
+    )
+    parser.add_argument(
+        "-t", "--threshold",
+        dest="threshold",
+        type=float,
+        default=None,
+        help="`log` writes a sample only if its value changed by more than this",
+    )
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        action="store_true",
+        help="print how long the phases of each command take (count, p50, p95, max) to STDERR on exit or on SIGUSR1",
+    )
+    parser.add_argument(
+        "--timings",
+        dest="timings",
+        type=str,
+        default=None,
+        help="write the phase timings of each command as JSON lines to this file",
+    )
+    parser.add_argument(
+        "--pacing",
+        dest="pacing",
+        choices=PACINGS,
+        default="fixed",
+        help="`fixed`: wait 0.25 s between button presses, `adaptive`: confirm each press by polling the status (default:fixed)",
+    )
+    parser.add_argument(
+        "-k", "--keep-going",
+        dest="keep_going",
+        action="store_true",
+        help="continue `batch` after a command fails",
+    )
+    parser.add_argument(
+        "--latency",
+        dest="latency",
+        type=float,
+        default=0.0,
+        help="response latency of `simulate` [s] (default:0)",
+    )
+    parser.add_argument(
+        "--baud",
+        dest="baud",
+        type=int,
+        default=None,
+        help="pace responses of `simulate` like a serial line at this baud rate (default: no pacing)",
+    )
+    parser.add_argument(
+        "--corrupt",
+        dest="corrupt",
+        type=float,
+        default=0.0,
+        help="probability that `simulate` corrupts a response (default:0)",
+    )
+    parser.add_argument(
+        "--settle",
+        dest="settle",
+        type=float,
+        default=0.0,
+        help="delay before button presses take effect in `simulate` [s] (default:0)",
+    )
     parser.add_argument(
             "-s", "--sep", dest="sep", type=str, default=",", help="separator for csv (default:',')"
     )
     parser.add_argument(
-        "command", nargs="?", type=str, help="command to send to instrument"
+    "command", nargs="?", type=str, help="command to send to instrument"
     )
     parser.add_argument(
-        "args", nargs="*", help="arguments to command"
+    "args", nargs="*", help="arguments to command"
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.db is not None:
+        args.format = "sqlite"
+    elif args.format == "sqlite":
+        parser.error("-f sqlite requires --db")
+    if args.ports is None:
+        args.ports = ["/dev/ttyUSB0"]
+    args.port = args.ports[0]
+
+    return args
 
 
 if __name__ == "__main__":
@@ -0,0 +1,406 @@
+"""Tests for pce174.py
+
+Run with `python -m pytest` from the repository root.
+"""
+
+import argparse, datetime, io, random, time, warnings
+
+import pytest
+
+import pce174
+
+warnings.simplefilter("ignore", DeprecationWarning)
+
+DECODERS = [d for d in pce174.DECODERS if d != "numpy" or pce174.np is not None]
+# stat0 bytes with a valid mode (modes 001 and 111 do not exist)
+VALID_STAT0 = [byte for byte in range(256) if pce174.STAT0_TABLE[byte] is not None]
+INVALID_STAT0 = [byte for byte in range(256) if pce174.STAT0_TABLE[byte] is None]
+T0 = datetime.datetime(2019, 3, 10, 17, 22, 0)
+
+
+def decode(blob, datatype, outformat, decoder):
+    "return the decoded blob or the type of the exception raised"
+
+    try:
+        return pce174.decode_blob(blob, datatype, outformat, ",", decoder=decoder)
+    except Exception as e:
+        return type(e)
+
+
+def assert_equivalent(blob, datatype):
+    "assert that all decoders give the same repr and csv output for blob"
+
+    for outformat in ("repr", "csv"):
+        expected = decode(blob, datatype, outformat, "construct")
+        for decoder in DECODERS:
+            assert decode(blob, datatype, outformat, decoder) == expected, (datatype, outformat, decoder)
+
+
+def random_time(rnd):
+    return T0 + datetime.timedelta(seconds=rnd.randrange(10 ** 8))
+
+
+def random_live(rnd):
+    return pce174.encode_live_data(
+        random_time(rnd), rnd.randrange(10000), rnd.randrange(10000), rnd.choice(VALID_STAT0),
+        rnd.randrange(256), rnd.randrange(100), rnd.randrange(100),
+    )
+
+
+def random_saved(rnd):
+    records = [
+        (random_time(rnd), rnd.randrange(10000), rnd.choice(VALID_STAT0), rnd.randrange(256))
+        for i in range(rnd.randrange(100))
+    ]
+    return pce174.encode_saved_data(records, trailing=rnd.randrange(50))
+
+
+def random_logger(rnd):
+    groups = [
+        (groupno, rnd.randrange(1, 60), random_time(rnd),
+         [(rnd.randrange(10000), rnd.choice(VALID_STAT0)) for i in range(rnd.randrange(300))])
+        for groupno in range(1, rnd.randrange(2, 6))
+    ]
+    return pce174.encode_logger_data(groups)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_blobs(seed):
+    rnd = random.Random(seed)
+    assert_equivalent(random_live(rnd), "live")
+    assert_equivalent(random_saved(rnd), "saved")
+    assert_equivalent(random_logger(rnd), "logger")
+
+
+def test_fixed_blobs():
+    assert_equivalent(pce174.encode_live_data(T0, 146, 146, 0b10000001, 0b00001000), "live")
+    assert_equivalent(pce174.encode_live_data(T0, 9999, 0, 0b11110111, 0b00111111, 99, 99), "live")
+    assert_equivalent(pce174.encode_saved_data([]), "saved")
+    assert_equivalent(pce174.encode_saved_data([(T0, 5, 0b10000001, 0b00000001)] * 99, trailing=40), "saved")
+    assert_equivalent(pce174.encode_logger_data([]), "logger")
+    assert_equivalent(pce174.encode_logger_data([(1, 2, T0, [(146, 0b10000001)] * 3)]), "logger")
+
+
+def test_live_values():
+    dat = pce174.decode_blob(pce174.encode_live_data(T0, 146, 146, 0b10000001, 0b00001000), "live", "repr", ",")
+    assert dat["date"] == "2019-03-10"
+    assert dat["time"] == "17:22:00"
+    assert dat["value"] == 14.6
+    assert dat["range"] == "400"
+    assert dat["view"] == "sampling"
+
+
+@pytest.mark.parametrize("stat0", INVALID_STAT0)
+def test_invalid_stat0(stat0):
+    blobs = {
+        "live": pce174.encode_live_data(T0, 146, 146, stat0, 0),
+        "saved": pce174.encode_saved_data([(T0, 146, stat0, 0)]),
+        "logger": pce174.encode_logger_data([(1, 2, T0, [(146, 0b10000001), (146, stat0)])]),
+    }
+    for datatype, blob in blobs.items():
+        assert_equivalent(blob, datatype)
+        for decoder in DECODERS:
+            assert decode(blob, datatype, "csv", decoder) is ValueError
+
+
+def corrupted_saved():
+    "return a saved data blob with broken seconds in register 2 and a broken mode in register 3"
+
+    blob = bytearray(pce174.encode_saved_data([(T0, 146, 0b10000001, 0), (T0, 147, 0b10000001, 0),
+                                               (T0, 148, 0b10000010, 0)]))
+    blob[2 + pce174.SAVED_LAYOUT.size + 7] = 0x61
+    blob[2 + 2 * pce174.SAVED_LAYOUT.size + 11] = 0b10001010  # mode 001
+    return bytes(blob)
+
+
+@pytest.mark.parametrize("decoder", DECODERS)
+def test_invalid_saved(decoder):
+    blob = corrupted_saved()
+    with pytest.raises(ValueError):
+        pce174.decode_blob(blob, "saved", "repr", ",", decoder=decoder)
+    dat = pce174.decode_blob(blob, "saved", "repr", ",", decoder=decoder, invalid="drop")
+    assert [rec["pos"] for rec in dat] == [1]
+    dat = pce174.decode_blob(blob, "saved", "repr", ",", decoder=decoder, invalid="emit")
+    assert [(rec["pos"], rec["time"]) for rec in dat] == [
+        (1, datetime.time(17, 22)), (2, "17:22:61"), (3, "17:22:00")]
+    assert [(rec["mode"], rec["unit"], rec["range"]) for rec in dat] == [
+        ("normal", "lux", "400"), ("normal", "lux", "400"), (None, "lux", "4k")]
+    dat = pce174.decode_blob(blob, "saved", "repr", ",", decoder=decoder, invalid="clamp")
+    assert [rec["time"] for rec in dat] == [datetime.time(17, 22), datetime.time(17, 22, 59), datetime.time(17, 22)]
+    assert [(rec["mode"], rec["unit"], rec["range"]) for rec in dat] == [
+        ("normal", "lux", "400"), ("normal", "lux", "400"), (None, "lux", "4k")]
+    # unless invalid is raise, all decoders give the same output
+    for invalid in ("emit", "clamp", "drop"):
+        for outformat in ("repr", "csv"):
+            assert pce174.decode_blob(blob, "saved", outformat, ",", decoder=decoder, invalid=invalid) == \
+                pce174.decode_blob(blob, "saved", outformat, ",", decoder="fast", invalid=invalid)
+
+
+@pytest.mark.filterwarnings("ignore:Pseudo-tetrade")
+@pytest.mark.parametrize("offset", range(3, 10))
+def test_pseudo_tetrades(offset):
+    # date and time bytes with nibbles > 9
+    for nibbles in (0x0a, 0xa0, 0x1f, 0xff):
+        blob = bytearray(pce174.encode_live_data(T0, 146, 146, 0b10000001, 0))
+        blob[offset] = nibbles
+        assert_equivalent(bytes(blob), "live")
+        blob = bytearray(pce174.encode_saved_data([(T0, 146, 0b10000001, 0)]))
+        blob[offset] = nibbles
+        assert_equivalent(bytes(blob), "saved")
+        blob = bytearray(pce174.encode_logger_data([(1, 2, T0, [(146, 0b10000001)])]))
+        blob[5 + offset + 3] = nibbles
+        assert_equivalent(bytes(blob), "logger")
+
+
+def test_group_magic_straddling_records():
+    # stat0 0xaa followed by valH 0x56 (86) looks like the group magic number
+    points = [(146, 0xaa), (8612, 0xaa), (8600, 0b10000001), (5600, 0xaa)]
+    blob = pce174.encode_logger_data([(1, 2, T0, points), (2, 3, T0, points[::-1])])
+    assert b"\xaa\x56" in blob[5 + 13 : 5 + 13 + 3 * len(points)]
+    assert_equivalent(blob, "logger")
+    index = pce174.index_logger_groups(blob)
+    assert [(g.groupno, g.points) for g in index] == [(1, 4), (2, 4)]
+    dat = pce174.decode_blob(blob, "logger", "repr", ",")
+    assert [rec["value"] for rec in dat[:4]] == [146.0, 8612.0, 860.0, 5600.0]
+
+
+def test_empty_group():
+    # the construct parser needs at least one data record per group, the
+    # other decoders accept empty groups
+    blob = pce174.encode_logger_data([(1, 2, T0, []), (2, 2, T0, [(146, 0b10000001)])])
+    for outformat in ("repr", "csv"):
+        expected = decode(blob, "logger", outformat, "fast")
+        assert expected != decode(blob, "logger", outformat, "construct")
+        for decoder in DECODERS[1:]:
+            assert decode(blob, "logger", outformat, decoder) == expected
+    assert [rec["groupno"] for rec in pce174.decode_blob(blob, "logger", "repr", ",")] == [2]
+
+
+def test_archive(tmp_path):
+    path = str(tmp_path / "light.pca")
+    blobs = [pce174.encode_live_data(T0 + datetime.timedelta(seconds=i), i, i, 0b10000001, 0) for i in range(10)]
+    with pce174.FrameArchive(path, "a", interval=4) as archive:
+        for i, blob in enumerate(blobs[:6]):
+            archive.append(1000.0 + i, blob)
+    # a partial record left by a crash is dropped when appending again
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 5)
+    with pce174.FrameArchive(path, "a", interval=4) as archive:
+        for i, blob in enumerate(blobs[6:], 6):
+            archive.append(1000.0 + i, blob)
+    assert len(open(path + ".idx", "rb").read()) == 3 * pce174.ARCHIVE_INDEX.size
+    with pce174.FrameArchive(path) as archive:
+        assert len(archive) == 10
+        assert list(archive.read()) == [(1000.0 + i, blob) for i, blob in enumerate(blobs)]
+        assert list(archive.read(1005.0, 1009.0)) == [(1000.0 + i, blobs[i]) for i in range(5, 9)]
+        assert list(archive.read(1009.5)) == []
+    out = io.BytesIO()
+    assert pce174.extract_archive(path, "raw", start=1002.0, end=1004.0, out=out) == 2
+    assert out.getvalue() == blobs[2] + blobs[3]
+    out = io.BytesIO()
+    assert pce174.extract_archive(path, "hex", start=1002.0, end=1004.0, out=out) == 2
+    assert out.getvalue().splitlines() == [blobs[2].hex().encode(), blobs[3].hex().encode()]
+    out = io.BytesIO()
+    assert pce174.extract_archive(path, "csv", start=1002.0, end=1004.0, out=out) == 2
+    lines = out.getvalue().decode().splitlines()
+    assert lines[0] == ",".join(pce174.LIVE_COLUMNS)
+    assert [line.split(",")[3] for line in lines[1:]] == ["0.2", "0.3"]
+
+def test_timer_report_in_handler():
+    # the SIGUSR1 handler may interrupt the main thread while it holds the lock
+    timer = pce174.PhaseTimer()
+    timer.begin("0x11")
+    with timer.phase("decode"):
+        pass
+    with timer.lock:
+        timer.finish()
+        assert "decode" in timer.report()
+
+@pytest.mark.parametrize("start, settings, plan", [
+    ({"mode": "max"}, {"mode": "Pmax"}, [("rel", 2), ("peak", 1)]),
+    ({"mode": "rel"}, {"mode": "min"}, [("rel", 1), ("max", 2)]),
+    ({"mode": "Pmin"}, {"mode": "rel"}, [("rel", 3)]),
+    ({"view": "time"}, {"view": "sampling"}, [("RIGHT", 3)]),
+    ({"unit": "lux", "range": "400"}, {"unit": "fc", "range": "4k"}, [("units", 1), ("range", 2)]),
+    ({}, {"apo": "on"}, None),
+])
+def test_plan_presses(start, settings, plan):
+    stat = dict({"unit": "lux", "range": "400", "mode": "normal", "hold": "cont", "apo": "off", "view": "time",
+                 "memstat": None}, **start)
+    assert pce174.plan_presses(stat, settings) == plan
+    if plan is not None:
+        # only presses with a known effect are used
+        for button, n in plan:
+            for i in range(n):
+                assert pce174.press_known(stat, button)
+                stat = pce174.press_effect(stat, pce174.BUTTONS[button])
+        assert all(stat[var] == value for var, value in settings.items())
+
+def test_logger_cache(tmp_path, capsys):
+    path = str(tmp_path / "groups.json")
+    t1, t2 = T0 + datetime.timedelta(hours=1), T0 + datetime.timedelta(hours=2)
+    a = [(100 + i, 0b10000001) for i in range(5)]
+    b = [(200 + i, 0b10000001) for i in range(4)]
+    c = [(300 + i, 0b10000001) for i in range(3)]
+    blob = pce174.encode_logger_data([(1, 2, T0, a), (2, 3, t1, b)])
+    cache = pce174.LoggerCache(path)
+    assert cache.update(blob) == {1: 0, 2: 0}
+    cache.save()
+    cache = pce174.LoggerCache(path)
+    assert cache.update(blob) == {}
+    # group 2 was still logging
+    blob = pce174.encode_logger_data([(1, 2, T0, a), (2, 3, t1, b + c)])
+    dat = pce174.new_logger_data(blob, cache, "repr", ",")
+    assert [(rec["groupno"], rec["id"]) for rec in dat] == [(2, 4), (2, 5), (2, 6)]
+    assert capsys.readouterr().err == ""
+    # group 1 was deleted and group 2 renumbered
+    blob = pce174.encode_logger_data([(1, 3, t1, b + c), (2, 2, t2, c)])
+    assert cache.update(blob) == {2: 0}
+    assert capsys.readouterr().err == "Logging group 2 was renumbered to 1\n"
+    assert len(cache.groups) == 2
+    # the logger memory was cleared and a group with the same start recorded
+    blob = pce174.encode_logger_data([(1, 3, t1, c)])
+    assert cache.update(blob) == {1: 0}
+    assert capsys.readouterr().err == "Logger memory was cleared since the last read\n"
+    assert len(cache.groups) == 1
+
+
+def test_logger_cache_groups(tmp_path):
+    blob = pce174.encode_logger_data([(1, 2, T0, [(100, 0b10000001)]), (2, 2, T0, [(200, 0b10000001)])])
+    cache = pce174.LoggerCache(str(tmp_path / "groups.json"))
+    assert cache.update(blob, groups=[2]) == {2: 0}
+    # the unselected group is still new and the selected one is kept
+    assert cache.update(blob, groups=[1]) == {1: 0}
+    assert cache.update(blob) == {}
+    assert pce174.new_logger_data(blob, cache, "csv", ",") == ",".join(pce174.LOGGER_COLUMNS)
+    assert pce174.new_logger_data(blob, cache, "csv", ",", header=False) == ""
+
+def test_sqlite_upsert(tmp_path):
+    path = str(tmp_path / "light.db")
+    saved = [(T0 + datetime.timedelta(minutes=i), 100 + i, 0b10000001, 0) for i in range(20)]
+    t1 = T0 + datetime.timedelta(hours=1)
+    logger = [(1, 2, T0, [(100 + i, 0b10000001) for i in range(2)]), (2, 3, t1, [(5, 0b10000001)])]
+    with pce174.SQLiteWriter(path) as db:
+        for i in range(2):
+            assert db.write("saved", pce174.decode_blob(pce174.encode_saved_data(saved), "saved", "repr", ",")) == 20
+            assert db.write("logger", pce174.decode_blob(pce174.encode_logger_data(logger), "logger", "repr", ",")) == 3
+        # rows read again with other values are updated
+        logger[1] = (2, 3, t1, [(7, 0b10000001)])
+        db.write("logger", pce174.decode_blob(pce174.encode_logger_data(logger), "logger", "repr", ","))
+        assert db.db.execute("SELECT COUNT(*) FROM saved").fetchone() == (20,)
+        assert db.db.execute("SELECT COUNT(*) FROM logger").fetchone() == (3,)
+        assert db.db.execute("SELECT value FROM logger WHERE groupno = 2").fetchone() == (0.7,)
+
+
+def test_sqlite_batches(tmp_path):
+    path = str(tmp_path / "light.db")
+    rec = pce174.decode_blob(pce174.encode_live_data(T0, 146, 146, 0b10000001, 0), "live", "repr", ",")
+    reader = pce174.sqlite3.connect(path)
+    with pce174.SQLiteWriter(path, batch_size=3, batch_time=3600) as db:
+        db.add(rec, port="a")
+        db.add(rec, port="b")
+        assert reader.execute("SELECT COUNT(*) FROM live").fetchone() == (0,)
+        db.add(rec, port="c")
+        assert reader.execute("SELECT COUNT(*) FROM live").fetchone() == (3,)
+        db.add(rec, port="d")
+        assert len(db.pending) == 1
+    # pending records are committed on close
+    assert reader.execute("SELECT COUNT(*) FROM live").fetchone() == (4,)
+    reader.close()
+
+# Tests against the simulator (see Simulator), they need a pseudo-terminal
+needs_pty = pytest.mark.skipif(not hasattr(pce174.os, "openpty"), reason="the simulator needs a pseudo-terminal")
+
+
+@pytest.fixture
+def sim():
+    with pce174.Simulator(seed=1) as sim:
+        yield sim
+
+
+@pytest.fixture
+def meter(sim):
+    with pce174.PCE174(sim.port, decoder="fast") as meter:
+        yield meter
+
+
+@needs_pty
+def test_sim_read(sim, meter):
+    dat = meter.read_data("live")
+    assert dat["value"] == 14.6
+    assert dat["unit"] == "lux"
+    assert meter.read_data("saved") == pce174.decode_blob(pce174.encode_saved_data(sim.saved), "saved", "repr", ",")
+    assert meter.read_data("logger") == pce174.decode_blob(pce174.encode_logger_data(sim.logger), "logger", "repr", ",")
+    assert sim.received == 3
+
+
+@needs_pty
+def test_sim_press(meter):
+    meter.press_button("hold")
+    assert meter.getvar("hold") == "hold"
+    meter.press_button("hold")
+    assert meter.getvar("hold") == "cont"
+
+
+@needs_pty
+@pytest.mark.parametrize("pacing", pce174.PACINGS)
+def test_sim_setvars(sim, pacing):
+    with pce174.PCE174(sim.port, pacing=pacing) as meter:
+        meter.setvars({"unit": "fc", "range": "4k", "mode": "max", "view": "year"})
+        stat = meter.read_data("live")
+    assert (stat["unit"], stat["range"], stat["mode"], stat["view"]) == ("fc", "4k", "max", "year")
+
+
+@needs_pty
+def test_sim_log(meter, capsys):
+    summary = meter.log_live_data("csv", sampleno=3, interval=0.05)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == ",".join(pce174.LIVE_COLUMNS)
+    assert len(lines) == 4
+    assert summary["samples"] == 3
+
+
+@needs_pty
+def test_sim_latency():
+    with pce174.Simulator(latency=0.05) as sim, pce174.PCE174(sim.port) as meter:
+        start = time.monotonic()
+        blob = meter.send_cmd(0x11, read=True)
+        assert time.monotonic() - start >= 0.05
+    assert len(blob) == 18
+
+
+@needs_pty
+def test_sim_corrupt():
+    with pce174.Simulator(corrupt=1.0, seed=1) as sim, pce174.PCE174(sim.port) as meter:
+        corrupted = meter.send_cmd(0x12, read=True)
+    assert corrupted != pce174.encode_saved_data(sim.saved)
+
+
+@needs_pty
+def test_sim_batch(meter, capsys):
+    args = argparse.Namespace(keep_going=True)
+    lines = ["# comment\n", "get unit\n", "get 'unit\n", "bogus\n", "get hold\n"]
+    assert pce174.run_batch(meter, lines, args) == 2
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == ["lux", "cont"]
+    assert captured.err.splitlines()[0] == "line 3: ValueError: No closing quotation"
+
+
+
+@needs_pty
+def test_sim_replay(sim, tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    with pce174.WireCapture(path) as capture, pce174.PCE174(sim.port, decoder="fast", capture=capture) as meter:
+        live = meter.send_cmd(0x11, read=True)
+        meter.press_button("hold")
+        logger = meter.send_cmd(0x13, read=True)
+    responses = [(cmd, blob) for t, port, cmd, blob in pce174.capture_responses(path) if cmd in pce174.DATA_COMMANDS]
+    assert responses == [(0x11, live), (0x13, logger)]
+    out = io.BytesIO()
+    assert pce174.replay(path, "hex", speed=0, out=out) == 2
+    assert out.getvalue().splitlines() == [live.hex().encode(), logger.hex().encode()]
+    out = io.BytesIO()
+    assert pce174.replay(path, "csv", speed=0, out=out) == 2
+    expected = pce174.decode_blob(live, "live", "csv", ",", header=True) + "\n"
+    expected += pce174.decode_blob(logger, "logger", "csv", ",", header=True) + "\n"
+    assert out.getvalue().decode() == expected